@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the cold start cost of ``import version_filter``.
+
+Every sample runs in a fresh interpreter, the bare interpreter start up time is measured the same way and subtracted
+so only the cost of the import itself is reported.  Pass ``--max-ms`` to fail (exit 1) when the median import cost
+exceeds a budget, e.g. from CI.
+
+    python benchmarks/import_time.py --runs 30 --max-ms 25
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def _time_statement(statement, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    cmd = [sys.executable, '-c', statement]
+    samples = []
+    for _ in range(runs):
+        start = timeit.default_timer()
+        subprocess.check_call(cmd, env=env)
+        samples.append((timeit.default_timer() - start) * 1000.0)
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20, help='number of fresh interpreters per measurement')
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if the median import cost exceeds this')
+    args = parser.parse_args(argv)
+
+    baseline = _time_statement('pass', args.runs)
+    imported = _time_statement('import version_filter', args.runs)
+    cost = _median(imported) - _median(baseline)
+
+    print('interpreter start up: {:.1f} ms (median of {})'.format(_median(baseline), args.runs))
+    print('import version_filter: {:.1f} ms (median of {})'.format(_median(imported), args.runs))
+    print('import cost: {:.1f} ms'.format(cost))
+
+    if args.max_ms is not None and cost > args.max_ms:
+        print('import cost exceeds the {:.1f} ms budget'.format(args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
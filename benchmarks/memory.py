@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the memory used by filtering large synthetic version lists, and check it against stored budgets.
+
+For every corpus size and mask, tracemalloc reports:
+
+* ``version_bytes``: the memory held per parsed version, once a ``VersionIndex`` of the corpus is built
+* ``peak_bytes``: the peak memory allocated by one ``semver_filter`` call, the version strings themselves excluded
+* ``retained_bytes``: the memory still held once the call returned, i.e. its result
+
+Budgets are the numbers of a stored baseline plus a tolerance.  ``--check`` fails (exit 1) when a measurement exceeds
+its budget, ``--update-baseline`` stores the measurements as the new baseline.  tracemalloc numbers depend on the
+Python version, compare against a baseline made with the same one.
+
+    python benchmarks/memory.py --sizes 100000 1000000 --check
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from version_filter import VersionFilter, compile_mask  # noqa: E402
+from version_filter.version_filter import VersionIndex  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'memory_baseline.json')
+CURRENT_VERSION = '50.50.5'
+MASKS = ['L.Y.Y', '>=10.0.0 && <90.0.0', 'Y.Y.Y-Y', '-L.L.Y']
+
+
+def _versions(count):
+    """count distinct version strings, about one in ten of them a prerelease, with a few missing patches for next best
+       masks to find"""
+    versions = []
+    major = 0
+    while len(versions) < count:
+        for minor in range(100):
+            for patch in range(10):
+                if patch == 7 and minor % 3 == 0:
+                    continue
+                versions.append('{}.{}.{}'.format(major, minor, patch))
+                if patch == 0:
+                    versions.append('{}.{}.{}-rc.1'.format(major, minor, patch))
+        major += 1
+    return versions[:count]
+
+
+def _traced(function):
+    """Run function under tracemalloc, returning its result along with the peak and retained memory it allocated"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = function()
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak - before, after - before
+
+
+def measure(size, masks):
+    versions = _versions(size)
+    measurements = {}
+
+    index, _, retained = _traced(lambda: VersionIndex(versions))
+    measurements['{} versions'.format(size)] = {'version_bytes': retained // len(index)}
+    del index
+
+    for mask in masks:
+        compile_mask(mask, CURRENT_VERSION)  # compiled masks are cached, their memory isn't part of a call
+        _, peak, retained = _traced(lambda: VersionFilter.semver_filter(mask, versions, CURRENT_VERSION))
+        measurements['{} versions {}'.format(size, mask)] = {'peak_bytes': peak, 'retained_bytes': retained}
+    return measurements
+
+
+def check(measurements, baseline, tolerance):
+    """Return the measurements over their budget"""
+    failures = []
+    for name, values in sorted(measurements.items()):
+        for metric, value in sorted(values.items()):
+            budget = baseline.get(name, {}).get(metric)
+            if budget is not None and value > budget * (1 + tolerance):
+                failures.append('{} {}: {} bytes, over the {:.0f} bytes budget'.format(
+                    name, metric, value, budget * (1 + tolerance)))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000], help='corpus sizes to measure')
+    parser.add_argument('--masks', nargs='+', default=MASKS, help='masks to filter with')
+    parser.add_argument('--baseline', default=BASELINE, help='file of the stored baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='budget over the baseline, 0.1 for 10%%')
+    parser.add_argument('--check', action='store_true', help='fail if a measurement exceeds its budget')
+    parser.add_argument('--update-baseline', action='store_true', help='store the measurements as the baseline')
+    args = parser.parse_args(argv)
+
+    measurements = {}
+    for size in args.sizes:
+        measurements.update(measure(size, args.masks))
+
+    for name, values in sorted(measurements.items()):
+        print('{}: {}'.format(name, ', '.join('{} {:,}'.format(metric, value)
+                                                for metric, value in sorted(values.items()))))
+
+    python = '{}.{}'.format(*sys.version_info[:2])
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': python, 'measurements': measurements}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('baseline stored in {}'.format(args.baseline))
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('python') != python:
+            print('warning: the baseline was made with python {}, not {}'.format(baseline.get('python'), python))
+        failures = check(measurements, baseline['measurements'], args.tolerance)
+        for failure in failures:
+            print(failure)
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure how filtering throughput scales with the number of threads sharing one compiled mask.
+
+Every thread filters the same synthetic versions with the same cached ``SpecMask`` (see ``compile_mask``), and the
+results are checked against a single threaded run.  With the GIL throughput stays flat, on a free-threaded Python it
+should grow with the thread count.
+
+    python benchmarks/thread_scaling.py --threads 1 2 4 8 --calls 50
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from version_filter import VersionFilter, compile_mask  # noqa: E402
+
+
+def _versions(count):
+    versions = []
+    major = 0
+    while len(versions) < count:
+        for minor in range(20):
+            for patch in range(10):
+                versions.append('{}.{}.{}'.format(major, minor, patch))
+                versions.append('{}.{}.{}-rc.1'.format(major, minor, patch))
+        major += 1
+    return versions[:count]
+
+
+def _run(threads, calls, mask, versions, current_version, expected):
+    errors = []
+    barrier = threading.Barrier(threads) if hasattr(threading, 'Barrier') else None
+
+    def worker():
+        if barrier is not None:
+            barrier.wait()
+        for _ in range(calls):
+            if VersionFilter.semver_filter(mask, versions, current_version) != expected:
+                errors.append('mismatch')
+                return
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = timeit.default_timer()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = timeit.default_timer() - start
+    if errors:
+        raise AssertionError('threaded results differ from the single threaded ones')
+    return threads * calls / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help='thread counts to measure')
+    parser.add_argument('--calls', type=int, default=20, help='filter calls per thread')
+    parser.add_argument('--versions', type=int, default=10000, help='number of versions to filter')
+    parser.add_argument('--mask', default='L.Y.Y || 5.Y.Y || -6.Y.0', help='mask to filter with')
+    parser.add_argument('--current-version', default='3.4.5', help='current version for the LOCKs of the mask')
+    args = parser.parse_args(argv)
+
+    versions = _versions(args.versions)
+    compile_mask(args.mask, args.current_version)  # shared by every thread from here on
+    expected = VersionFilter.semver_filter(args.mask, versions, args.current_version)
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('python {} ({})'.format(sys.version.split()[0], 'GIL' if gil else 'free-threaded'))
+    print('mask {!r}, {} versions, {} matches'.format(args.mask, len(versions), len(expected)))
+
+    single = None
+    for threads in args.threads:
+        throughput = _run(threads, args.calls, args.mask, versions, args.current_version, expected)
+        single = single or throughput
+        print('{:3d} threads: {:8.1f} calls/s ({:.2f}x)'.format(threads, throughput, throughput / single))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,6 +31,11 @@ setup(
     package_dir={'version_filter':
                  'version_filter'},
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'version-filter=version_filter.cli:main',
+        ],
+    },
     install_requires=requirements,
     license="MIT license",
     zip_safe=False,
@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from version_filter import VersionFilter
+from version_filter.cache import MemoryBackend, ResultCache, SQLiteBackend, VersionsFingerprint
+from version_filter.version_filter import _parse_semver, UnsortedVersionsError, INDICES, INPUT, VERSIONS
+
+VERSIONS_ = ['1.0.0', 'v1.1.0', '2.0.0-alpha', 'junk', '2.0.0', '1.0.5', '2.1.0']
+
+
+def test_fingerprint():
+    fingerprint = VersionsFingerprint(VERSIONS_)
+    assert fingerprint.count == len(VERSIONS_)
+    assert fingerprint == VersionsFingerprint(list(VERSIONS_))
+    assert fingerprint != VersionsFingerprint(VERSIONS_[::-1])
+    assert fingerprint != VersionsFingerprint(VERSIONS_[:-1])
+    assert VersionsFingerprint(['1.0.01.0.0']) != VersionsFingerprint(['1.0.0', '1.0.0'])
+
+    extended = VersionsFingerprint(VERSIONS_[:3]).extend(VERSIONS_[3:])
+    assert extended == fingerprint
+    assert hash(extended) == hash(fingerprint)
+    assert str(extended) == str(fingerprint)
+
+
+def test_fingerprint_extend_leaves_the_original():
+    fingerprint = VersionsFingerprint(VERSIONS_[:3])
+    before = str(fingerprint)
+    fingerprint.extend(VERSIONS_[3:])
+    assert str(fingerprint) == before
+    assert fingerprint.count == 3
+
+
+@pytest.mark.parametrize('output', [None, VERSIONS, INDICES])
+def test_result_cache(output):
+    cache = ResultCache()
+    kwargs = {'output': output} if output else {}
+    for mask, current_version in [('Y.Y.Y', None), ('L.Y.Y', '1.0.0'), ('-L.Y.Y', '1.0.0'), ('Y.Y.Y-Y', '1.0.0')]:
+        expected = VersionFilter.semver_filter(mask, VERSIONS_, current_version, **kwargs)
+        assert cache.semver_filter(mask, VERSIONS_, current_version, **kwargs) == expected
+        assert cache.semver_filter(mask, VERSIONS_, current_version, **kwargs) == expected
+    assert (cache.hits, cache.misses) == (4, 4)
+    assert cache.hit_rate == 0.5
+
+
+def test_result_cache_hits_dont_parse_strings(monkeypatch):
+    from semantic_version import Version
+    cache = ResultCache()
+    versions = ['1.0.0', 'v1.1.0', Version('1.2.0'), '=1.3.0']
+    expected = VersionFilter.semver_filter('Y.Y.Y', versions)
+    assert cache.semver_filter('Y.Y.Y', versions) == expected
+    parsed = []
+    monkeypatch.setattr('version_filter.cache._parse_semver', lambda v: parsed.append(v) or _parse_semver(v))
+    assert cache.semver_filter('Y.Y.Y', versions) == expected
+    assert parsed == [versions[2]]  # only the Version object is parsed on a hit
+
+
+def test_result_cache_keys():
+    cache = ResultCache()
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.0')
+    cache.semver_filter('Y.Y.Y || Y.Y.Y', VERSIONS_, '1.0.0')  # same canonical form
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.0', order=INPUT)
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.5')
+    cache.semver_filter('Y.Y.Y', VERSIONS_ + ['3.0.0'], '1.0.0')
+    assert cache.stats() == (1, 4, 0.2, 4)
+
+    cache.clear()
+    assert cache.stats() == (0, 0, 0.0, 0)
+
+
+def test_result_cache_keys_assume_sorted():
+    cache = ResultCache()
+    versions = ['2.0.0', '1.0.0', '2.0.0']
+    assert cache.semver_filter('Y.Y.Y', versions, assume_sorted=True) == VersionFilter.semver_filter(
+        'Y.Y.Y', versions, assume_sorted=True)
+    assert cache.semver_filter('Y.Y.Y', versions) == ['1.0.0', '2.0.0']
+    assert cache.misses == 2
+
+
+def test_result_cache_keys_check_sorted():
+    cache = ResultCache()
+    versions = ['2.0.0', '1.0.0']
+    cache.semver_filter('Y.Y.Y', versions, assume_sorted=True)
+    with pytest.raises(UnsortedVersionsError):
+        cache.semver_filter('Y.Y.Y', versions, assume_sorted=True, check_sorted=True)
+
+
+def test_result_cache_fingerprint():
+    cache = ResultCache()
+    versions = list(VERSIONS_)
+    fingerprint = VersionsFingerprint(versions)
+    assert cache.semver_filter('L.Y.Y', versions, '2.0.0', fingerprint=fingerprint) == ['2.1.0']
+
+    versions.append('2.2.0')
+    with pytest.raises(ValueError):
+        cache.semver_filter('L.Y.Y', versions, '2.0.0', fingerprint=fingerprint)
+    fingerprint = fingerprint.extend(['2.2.0'])
+    assert cache.semver_filter('L.Y.Y', versions, '2.0.0', fingerprint=fingerprint) == ['2.1.0', '2.2.0']
+    assert cache.misses == 2
+
+
+def test_result_cache_errors_are_not_cached():
+    cache = ResultCache()
+    with pytest.raises(ValueError):
+        cache.semver_filter('L.Y.Y', VERSIONS_)
+    with pytest.raises(ValueError):
+        cache.semver_filter('Y.Y.Y', VERSIONS_, output='bogus')
+    assert len(cache.backend) == 0
+
+
+def test_memory_backend_evicts():
+    cache = ResultCache(MemoryBackend(maxsize=2))
+    for current_version in ['1.0.0', '1.0.5', '2.0.0']:
+        cache.semver_filter('Y.Y.Y', VERSIONS_, current_version)
+    assert len(cache.backend) == 2
+
+
+def test_sqlite_backend(tmpdir):
+    path = str(tmpdir.join('results.db'))
+    backend = SQLiteBackend(path)
+    cache = ResultCache(backend)
+    assert cache.semver_filter('L.Y.Y', VERSIONS_, '1.0.0') == ['1.0.5', 'v1.1.0']
+    backend.close()
+
+    cache = ResultCache(SQLiteBackend(path))  # results outlive the backend
+    assert cache.semver_filter('L.Y.Y', VERSIONS_, '1.0.0') == ['1.0.5', 'v1.1.0']
+    assert cache.semver_filter('L.Y.Y', VERSIONS_, '1.0.0', output=INDICES) == [5, 1]  # outputs share results
+    assert cache.stats() == (2, 0, 1.0, 1)
+
+
+def test_sqlite_backend_evicts_least_recently_used(tmpdir):
+    cache = ResultCache(SQLiteBackend(str(tmpdir.join('results.db')), maxsize=2))
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.0')
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.5')
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.0')  # now the most recently used
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '2.0.0')
+    assert len(cache.backend) == 2
+    cache.semver_filter('Y.Y.Y', VERSIONS_, '1.0.0')
+    assert cache.hits == 2
@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+import json
+import subprocess
+import sys
+
+from version_filter.calibrate import NEVER, calibrate, synthetic_versions
+from version_filter.version_filter import _parse_semver
+
+
+def test_synthetic_versions():
+    versions = synthetic_versions(200, seed=1)
+    assert versions == synthetic_versions(200, seed=1)
+    assert len(set(versions)) == 200
+    assert len(set(_parse_semver(v).major for v in versions)) > 1
+    assert versions != sorted(versions, key=lambda v: _parse_semver(v).sort_key)
+
+
+def test_calibrate():
+    sizes = [4, 16, 64]
+    thresholds = calibrate(sizes, repeat=1)
+    assert set(thresholds) == {'scan_exact', 'scan_inexact', 'prefilter'}
+    assert thresholds['scan_exact'] in [0] + sizes
+    assert thresholds['scan_inexact'] in [0] + sizes
+    assert thresholds['prefilter'] in sizes + [NEVER]
+
+
+def test_calibrate_command(tmpdir):
+    path = str(tmpdir.join('calibration.json'))
+    output = subprocess.check_output([sys.executable, '-m', 'version_filter.calibrate', '--sizes', '4', '16',
+                                      '--repeat', '1', '--output', path])
+    thresholds = json.loads(output.decode('utf-8'))
+    with open(path) as f:
+        assert json.load(f) == {'thresholds': thresholds}
@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+import subprocess
+import sys
+
+import pytest
+
+from version_filter import VersionFilter
+from version_filter.ingest import filter_dump, iter_dump_versions
+from version_filter.version_filter import LimitExceededError, Limits
+
+DUMP = ('requests\t2.18.4\n'
+        'six\t1.11.0\r\n'
+        'requests\t2.19.0\n'
+        'requests-toolbelt\t0.8.0\n'
+        'requests\tjunk\n'
+        '\n'
+        'requests\tv2.19.0\n'
+        'requests\t3.0.0')
+
+
+@pytest.fixture
+def dump(tmpdir):
+    path = tmpdir.join('dump.tsv')
+    path.write_binary(DUMP.encode('utf-8'))
+    return str(path)
+
+
+def test_iter_dump_versions(dump, tmpdir):
+    assert list(iter_dump_versions(dump, 'requests')) == ['2.18.4', '2.19.0', 'junk', 'v2.19.0', '3.0.0']
+    assert list(iter_dump_versions(dump, 'six')) == ['1.11.0']
+    assert list(iter_dump_versions(dump, 'numpy')) == []
+    assert len(list(iter_dump_versions(dump))) == 7
+
+    versions = tmpdir.join('versions.txt')
+    versions.write_binary(b'1.0.0\n\n1.1.0\n')
+    assert list(iter_dump_versions(str(versions), separator=None)) == ['1.0.0', '1.1.0']
+    empty = tmpdir.join('empty.txt')
+    empty.write_binary(b'')
+    assert list(iter_dump_versions(str(empty))) == []
+
+
+def test_iter_dump_versions_majors(dump, tmpdir):
+    assert list(iter_dump_versions(dump, majors=((2, 2),))) == ['2.18.4', '2.19.0', 'junk', 'v2.19.0']
+    assert list(iter_dump_versions(dump, 'requests', majors=((3, None),))) == ['junk', '3.0.0']
+
+    # records of other majors are skipped before being decoded
+    versions = tmpdir.join('versions.txt')
+    versions.write_binary(b'1.0.0\n9.0.0-\xff\n\xc2\xb2.0.0\n')
+    assert list(iter_dump_versions(str(versions), separator=None, majors=((1, 1),))) == ['1.0.0', '\u00b2.0.0']
+    assert filter_dump(str(versions), 'L.Y.Y', '1.0.0', separator=None) == []
+    assert filter_dump(dump, 'L.Y.Y', '2.0.0') == ['2.18.4', '2.19.0']
+
+
+@pytest.mark.parametrize('mask,current_version', [
+    ('L.Y.Y', '2.0.0'),
+    ('Y.Y.Y', None),
+    ('>=2.19.0', None),
+    ('-Y.Y.1', None),
+])
+def test_filter_dump(dump, mask, current_version):
+    versions = list(iter_dump_versions(dump, 'requests'))
+    assert filter_dump(dump, mask, current_version, 'requests') == VersionFilter.semver_filter(mask, versions,
+                                                                                               current_version)
+
+
+def test_filter_dump_limits(dump):
+    with pytest.raises(LimitExceededError):
+        filter_dump(dump, 'Y.Y.Y', limits=Limits(None, None, 3, None))
+
+
+def test_cli(dump):
+    output = subprocess.check_output([sys.executable, '-m', 'version_filter', '-c', '2.0.0', '-p', 'requests',
+                                      'L.Y.Y', dump])
+    assert output.decode('utf-8').split() == ['2.18.4', '2.19.0']
+    output = subprocess.check_output([sys.executable, '-m', 'version_filter', '-n', '1', '--', '-Y.Y.1', dump])
+    assert output.decode('utf-8').split() == ['3.0.0']
@@ -0,0 +1,63 @@
+from __future__ import unicode_literals
+import json
+import subprocess
+import sys
+
+import pytest
+
+from version_filter.loadtest import generate_requests, package_versions, parse_mix, percentile, run
+
+
+def test_parse_mix():
+    assert parse_mix(['L.Y.Y:3', '>=1.0.0 && <2.0.0:0.5', 'Y.Y.Y']) == [
+        ('L.Y.Y', 3.0), ('>=1.0.0 && <2.0.0', 0.5), ('Y.Y.Y', 1.0)]
+    for mix in [['L.Y.Y:x'], ['L.Y.Y:-1'], ['nope:1'], ['L.Y.Y:0'], []]:
+        with pytest.raises(ValueError):
+            parse_mix(mix)
+
+
+def test_generate_requests():
+    mix = parse_mix(['L.Y.Y:1', 'Y.Y.Y:1'])
+    requests = generate_requests(500, 50, mix, seed=3, max_versions=40)
+    assert requests == generate_requests(500, 50, mix, seed=3, max_versions=40)
+    assert len(requests) == 500
+    for package, mask, current_version in requests:
+        assert mask in ('L.Y.Y', 'Y.Y.Y')
+        assert current_version in package_versions(3, package, 40)
+
+    popular = sum(1 for package, _, _ in requests if package < 5)
+    assert popular > 500 * 5 // 50  # skewed towards the first packages
+
+
+def test_generate_requests_needs_python_3_6(monkeypatch):
+    monkeypatch.setattr('version_filter.loadtest.ThreadPoolExecutor', None)
+    with pytest.raises(RuntimeError):
+        generate_requests(10, 5, parse_mix(['L.Y.Y']))
+
+
+def test_percentile():
+    latencies = [float(i) for i in range(1, 1001)]
+    assert percentile(latencies, 0.5) == 500.0
+    assert percentile(latencies, 0.99) == 990.0
+    assert percentile(latencies, 0.999) == 999.0
+    assert percentile([], 0.5) == 0.0
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_run(executor):
+    report = run(200, workers=2, executor=executor, packages=20, max_versions=50, result_cache=True)
+    assert report['requests'] == 200
+    assert report['errors'] == 0
+    latency = report['latency']
+    assert 0 < latency['p50'] <= latency['p99'] <= latency['p999'] <= latency['max']
+    assert report['throughput'] > 0
+    assert report['caches']['results']['hits'] + report['caches']['results']['misses'] == 200
+    assert 0 <= report['caches']['compiled masks']['hit_rate'] <= 1
+
+
+def test_loadtest_command():
+    output = subprocess.check_output([sys.executable, '-m', 'version_filter.loadtest', '--requests', '100',
+                                      '--packages', '10', '--versions', '30', '--json'])
+    report = json.loads(output.decode('utf-8'))
+    assert report['requests'] == 100
+    assert set(report['latency']) == {'p50', 'p99', 'p999', 'mean', 'max'}
@@ -0,0 +1,70 @@
+from __future__ import unicode_literals
+import subprocess
+import sys
+
+import pytest
+
+from version_filter import VersionFilter
+from version_filter import shared
+from version_filter.shared import SharedVersionTable
+
+pytestmark = pytest.mark.skipif(shared.shared_memory is None, reason='shared memory needs Python 3.8 or later')
+
+VERSIONS = ['0.9.0', 'v1.0.0', '1.0.1-rc.1', '1.0.1', '1.1.0-alpine', '1.1.0', '1.2.0+build.5', '1.3.0-alpine',
+            '2.0.0-rc.1', '2.0.0', 'not a version']
+
+
+@pytest.fixture
+def table():
+    table = SharedVersionTable.publish(VERSIONS)
+    yield table
+    table.close()
+    table.unlink()
+
+
+@pytest.mark.parametrize('mask,current_version', [
+    ('Y.Y.Y', None),
+    ('L.Y.Y', '1.0.0'),
+    ('L.L.Y-L', '1.1.0-alpine'),
+    ('Y.Y.Y-Y', None),
+    ('>=1.0.0 && <2.0.0', None),
+    ('^1.0.0 || 0.Y.Y', None),
+    ('-Y.Y.0', None),
+    ('-L.2.0', '1.0.0'),
+])
+def test_shared_table_matches_semver_filter(table, mask, current_version):
+    attached = SharedVersionTable.attach(table.name)
+    try:
+        assert attached.filter(mask, current_version) == VersionFilter.semver_filter(mask, VERSIONS, current_version)
+        assert attached.latest(mask, current_version, n=2) == VersionFilter.semver_latest(mask, VERSIONS,
+                                                                                       current_version, n=2)
+    finally:
+        attached.close()
+
+
+def test_shared_table_columns(table):
+    assert len(table) == 10
+    assert table.string(1) == 'v1.0.0'
+    assert table.keys[-1] == (2, 0, 0, (1,), ())
+    assert table[6].original_string == '1.2.0+build.5'
+    assert [table.string(i) for i in table.prerelease_buckets()[('alpine',)]] == ['1.1.0-alpine', '1.3.0-alpine']
+
+
+def test_shared_table_from_another_process(table):
+    code = ('from version_filter.shared import SharedVersionTable\n'
+            'table = SharedVersionTable.attach({!r})\n'
+            'print(table.filter("L.Y.Y", "1.0.0"))\n'
+            'table.close()\n').format(table.name)
+    output = subprocess.check_output([sys.executable, '-c', code]).decode('utf-8')
+    assert output.strip() == "{!r}".format(VersionFilter.semver_filter('L.Y.Y', VERSIONS, '1.0.0'))
+    assert table.filter('L.Y.Y', '1.0.0') == VersionFilter.semver_filter('L.Y.Y', VERSIONS, '1.0.0')
+
+
+def test_attach_rejects_other_shared_memory():
+    shm = shared.shared_memory.SharedMemory(create=True, size=64)
+    try:
+        with pytest.raises(ValueError):
+            SharedVersionTable(shm)
+    finally:
+        shm.close()
+        shm.unlink()
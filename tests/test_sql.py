@@ -0,0 +1,78 @@
+from __future__ import unicode_literals
+import sqlite3
+
+import pytest
+
+from version_filter import VersionFilter
+from version_filter.sql import compile_sql, filter_sqlite
+from version_filter.version_filter import _parse_semver
+
+VERSIONS = ['0.9.0', '1.0.0', '1.0.1', '1.1.0-alpha', '1.1.0', '1.2.0-rc.1', '1.2.0', '2.0.0-alpha', '2.0.0',
+            '2.0.1', '2.1.0', '3.0.0-rc.1', '3.0.0']
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE versions (version TEXT, major INTEGER, minor INTEGER, patch INTEGER, '
+                       'prerelease TEXT)')
+    for version in VERSIONS:
+        v = _parse_semver(version)
+        connection.execute('INSERT INTO versions VALUES (?, ?, ?, ?, ?)',
+                           (version, v.major, v.minor, v.patch, '.'.join(v.prerelease) or None))
+    return connection
+
+
+def _selected(connection, query):
+    rows = connection.execute('SELECT version FROM versions WHERE {} ORDER BY {}'.format(query.where, query.order_by),
+                              query.params)
+    return [version for version, in rows]
+
+
+@pytest.mark.parametrize('mask,current_version', [
+    ('Y.Y.Y', None),
+    ('Y.Y.Y-Y', None),
+    ('L.Y.Y', '1.0.0'),
+    ('L.L.Y', '1.0.0'),
+    ('1.Y.Y || 3.Y.Y', None),
+    ('>=1.0.1 && <2.0.0', None),
+    ('!=2.0.0', None),
+    ('>1.1.0-alpha && <2.0.0-alpha', None),
+    ('1.Y.Y-alpha', None),
+    ('~1.1', None),
+    ('-L.Y.0', '1.0.0'),
+])
+def test_filter_sqlite(connection, mask, current_version):
+    expected = VersionFilter.semver_filter(mask, VERSIONS, current_version)
+    assert filter_sqlite(connection, 'versions', mask, current_version, prerelease='prerelease') == expected
+    assert filter_sqlite(connection, 'versions', mask, current_version) == expected
+
+    query = compile_sql(mask, current_version, prerelease='prerelease')
+    if query.exact:
+        assert sorted(_selected(connection, query)) == sorted(expected)
+    assert query.post_filter(_selected(connection, query)) == expected
+
+
+def test_compile_sql_exact(connection):
+    query = compile_sql('L.Y.Y', '1.0.0', prerelease='prerelease')
+    assert query.exact
+    assert _selected(connection, query) == ['1.0.1', '1.1.0', '1.2.0']
+
+    assert not compile_sql('L.Y.Y', '1.0.0').exact  # releases only, without a prerelease column
+    assert not compile_sql('>1.1.0-alpha', prerelease='prerelease').exact
+    assert not compile_sql('-L.Y.0', '1.0.0', prerelease='prerelease').exact
+    assert compile_sql('>=1.0.1 && <2.0.0').exact
+
+
+def test_compile_sql_columns():
+    query = compile_sql('>=1.2.3', major='a', minor='b', patch='c', placeholder='%s')
+    assert query.where == 'a >= %s AND (a > %s OR (a = %s AND (b > %s OR (b = %s AND c >= %s))))'
+    assert query.params == (1, 1, 1, 2, 2, 3)
+    assert query.order_by == 'a, b, c'
+
+
+def test_compile_sql_invalid():
+    with pytest.raises(ValueError):
+        compile_sql('L.Y.Y')
+    with pytest.raises(ValueError):
+        compile_sql('not a mask')
@@ -1,9 +1,17 @@
 from __future__ import unicode_literals
+import subprocess
+import sys
+
 import pytest
 
 from version_filter import VersionFilter
 from version_filter import SpecItemMask, SpecMask
-from version_filter.version_filter import _parse_semver, InvalidSemverError, YesVersion
+from version_filter.version_filter import (_parse_semver, _bits_from_positions, _iter_bits, compile_mask,
+                                           InvalidSemverError, IntervalSet, LimitExceededError, Limits,
+                                           set_default_limits, UnsortedVersionsError, VersionIndex, YesVersion,
+                                           get_engine_thresholds, load_calibration, save_calibration,
+                                           set_engine_thresholds, INDICES, INPUT, MAJOR, MINOR, VERSIONS, AUTO, INDEX,
+                                           PREFILTER, SCAN)
 from semantic_version import Version, Spec
 
 
@@ -812,3 +820,599 @@ def test_validate_only():
     invalid_masks = ['-^1.1.1', 'a', '?.?.?', '', 'YY.0.0', 'LL.0.0']
     for m in invalid_masks:
         assert(VersionFilter.semver_validate(m) is False)
+
+
+def test_import_is_lazy():
+    """Importing the package must not pull in the distribution metadata machinery"""
+    code = ('import sys, version_filter; '
+            'print(",".join(m for m in ("pkg_resources", "future", "importlib.metadata") if m in sys.modules))')
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.decode().strip() == ''
+
+
+def test_version_is_resolved_on_access():
+    import version_filter
+    assert version_filter.__version__
+
+
+def test_semver_latest():
+    versions = ['1.8.0', '1.8.1', '1.8.2', '1.9.0', '1.9.1', '1.10.0', '2.0.0', 'nightly']
+    assert VersionFilter.semver_latest('L.Y.Y', versions, '1.8.0') == ['1.10.0']
+    assert VersionFilter.semver_latest('L.L.Y', versions, '1.8.0', n=2) == ['1.8.2', '1.8.1']
+    assert VersionFilter.semver_latest('Y.Y.Y', versions, n=100) == list(reversed(
+        VersionFilter.semver_filter('Y.Y.Y', versions)))
+    assert VersionFilter.semver_latest('L.L.Y', versions, '1.10.0') == []
+
+
+def test_semver_latest_next_best():
+    versions = ['1.0.0', '2.0.1', '2.0.2', '3.0.1']
+    assert VersionFilter.semver_latest('-Y.0.0', versions, '1.0.0') == ['3.0.1']
+    assert VersionFilter.semver_latest('-Y.0.0', versions, '1.0.0', n=5) == ['3.0.1', '2.0.1']
+
+
+def test_semver_filter_assume_sorted():
+    versions = ['1.8.0', '1.8.1', '1.8.2', '1.9.0', '1.9.1', '1.10.0', '2.0.0', '2.0.1', 'nightly']
+    for mask in ['L.Y.Y', 'Y.Y.0 || L.L.Y', '>1.8.0 && <2.0.0', '-Y.0.0', '*']:
+        expected = VersionFilter.semver_filter(mask, versions, '1.8.1')
+        assert VersionFilter.semver_filter(mask, versions, '1.8.1', assume_sorted=True) == expected
+        assert VersionFilter.semver_filter(mask, versions, '1.8.1', assume_sorted=True, check_sorted=True) == expected
+
+
+def test_semver_filter_assume_sorted_keeps_input_order():
+    versions = ['1.10.0', '1.9.0']
+    assert VersionFilter.semver_filter('Y.Y.Y', versions, assume_sorted=True) == ['1.10.0', '1.9.0']
+    with pytest.raises(UnsortedVersionsError):
+        VersionFilter.semver_filter('Y.Y.Y', versions, assume_sorted=True, check_sorted=True)
+
+
+def test_semver_latest_assume_sorted():
+    versions = ['1.8.0', '1.8.1', '1.8.2', '1.9.0', '1.9.1', '1.10.0', '2.0.0']
+    assert VersionFilter.semver_latest('L.L.Y', versions, '1.8.0', n=2, assume_sorted=True) == ['1.8.2', '1.8.1']
+
+
+def test_next_best_only_returns_real_versions():
+    mask = '-Y.Y.Y'
+    versions = ['1.0.0', '1.0.1', '1.0.5']
+    subset = VersionFilter.semver_filter(mask, versions)
+    assert subset == ['1.0.5']
+
+
+def test_bitsets():
+    bits = _bits_from_positions([0, 3, 64, 65], 70)
+    assert bits == (1 << 0) | (1 << 3) | (1 << 64) | (1 << 65)
+    assert list(_iter_bits(bits)) == [0, 3, 64, 65]
+    assert list(_iter_bits(bits, reverse=True)) == [65, 64, 3, 0]
+    assert _bits_from_positions([], 0) == 0
+    assert list(_iter_bits(0)) == []
+
+
+def test_specitemmask_matching_bits():
+    versions = [_parse_semver(x) for x in ['1.0.0', '1.0.1', '1.1.0', '2.0.0']]
+    assert SpecItemMask('1.0.Y').matching_bits(versions) == 0b0011
+    assert SpecItemMask('-1.0.2').matching_bits(versions) == 0b0100
+
+
+def test_next_best_matches_does_not_mutate_versions():
+    s = SpecItemMask('-L.L.0', current_version='1.2.3')
+    versions = [_parse_semver(x) for x in ['1.2.4', '1.3.1', '1.4.0', '2.0.0']]
+    original = list(versions)
+    assert s.next_best_matches(versions) == [_parse_semver('1.2.4')]
+    assert s.next_best_matches(versions) == [_parse_semver('1.2.4')]
+    assert versions == original
+    assert not any(hasattr(v, 'is_fake') for v in versions)
+
+
+def test_next_best_lock_large_index():
+    versions = ['{}.{}.{}'.format(major, minor, patch)
+                for major in range(1, 5) for minor in range(0, 30) for patch in range(1, 20)]
+    subset = VersionFilter.semver_filter('-L.L1.0', versions, '2.7.3')
+    assert subset == ['2.8.1']
+
+
+def test_next_best_or_comparison_newer_than_current():
+    versions = ['0.5.0', '1.0.2', '1.0.6', '1.5.0', '1.9.0', '3.0.0']
+    assert VersionFilter.semver_filter('-1.0.5 || <2.0.0', versions, '1.2.0') == ['1.5.0', '1.9.0']
+    assert VersionFilter.semver_filter('-1.0.5 || L.Y.Y', versions, '1.0.2') == ['1.0.6', '1.5.0', '1.9.0']
+    assert VersionFilter.semver_filter('-1.0.5 || <2.0.0', versions) == ['0.5.0', '1.0.2', '1.0.6', '1.5.0', '1.9.0']
+
+
+def test_semver_validate_many():
+    masks = ['L.Y.Y', '1.0 && >=bad', 'L.Y || 1 && 2', '-^1.0.0', ' * ', 'L.L.L-L.L.L']
+    diagnostics = VersionFilter.semver_validate_many(masks)
+    assert [d.mask for d in diagnostics] == masks
+    assert [d.valid for d in diagnostics] == [VersionFilter.semver_validate(m) for m in masks]
+    assert [d.valid for d in diagnostics] == [True, False, False, False, True, False]
+    assert (diagnostics[0].offset, diagnostics[0].reason) == (None, None)
+    assert diagnostics[1].offset == 7
+    assert '>=bad' in diagnostics[1].reason
+    assert diagnostics[2].offset == 9
+    assert diagnostics[3].offset == 0
+
+
+def test_semver_validate_agrees_with_specmask():
+    masks = ['1.0.0-01', 'L01.Y', 'L.L.Y-alpine3.6', '~=1', '>1.0.0-alpha.1 && <2', 'L-Linux', '-=1.0.0', '1.0.0+b',
+             '==1.0.0+b', 'L.Y-', 'Y.Y.Y-Y', '1..0', '']
+    for mask in masks:
+        try:
+            SpecMask(mask, validate_only=True)
+            valid = True
+        except ValueError:
+            valid = False
+        assert VersionFilter.semver_validate(mask) == valid, mask
+
+
+def test_specmask_canonical():
+    assert SpecMask(' 1.Y.Y ').canonical == '1.Y.Y'
+    assert SpecMask('1.0.0').canonical == SpecMask('=1.0.0').canonical == SpecMask('==1.0.0').canonical == '==1.0.0'
+    assert SpecMask('>=1.Y').canonical == '1.Y'
+    assert SpecMask('Y.Y.0 || L.L.Y', '1.8.1').canonical == '1.8.Y || Y.Y.0'
+    assert SpecMask('* && <2.0.0').canonical == '<2.0.0'
+    assert SpecMask('* || <2.0.0').canonical == '*'
+    assert SpecMask('1.0.0 && 1.0.0').canonical == '==1.0.0'
+    assert str(SpecMask('-Y.0.0')) == 'SpecMask <-Y.0.0>'
+
+
+def test_specmask_equality():
+    assert SpecMask('Y.Y.0 || L.L.Y', '1.8.1') == SpecMask('1.8.Y||Y.Y.0', '1.8.1')
+    assert hash(SpecMask('Y.Y.0 || L.L.Y', '1.8.1')) == hash(SpecMask('1.8.Y||Y.Y.0', '1.8.1'))
+    assert SpecMask('L.L.Y', '1.8.1') != SpecMask('L.L.Y', '1.8.2')
+    assert SpecMask('>1.0.0 && <2.0.0') == SpecMask('<2.0.0 && >1.0.0')
+    assert SpecMask('>1.0.0 && <2.0.0') != SpecMask('>1.0.0 || <2.0.0')
+    assert SpecItemMask('1.0.0') == SpecItemMask('==1.0.0')
+    assert len(set([SpecItemMask('1.0.0'), SpecItemMask('=1.0.0')])) == 1
+
+
+def test_compile_mask_shares_equivalent_masks():
+    assert compile_mask('L.L.Y || Y.Y.0', '1.8.1') is compile_mask(' Y.Y.0 || 1.8.Y ', 'v1.8.1')
+    assert compile_mask('L.L.Y', '1.8.1') is not compile_mask('L.L.Y', '1.8.2')
+
+
+def test_specmask_intervals():
+    s = SpecMask('L.L.Y || >=2.0.0-rc.1', '1.8.1')
+    assert repr(s.intervals) == 'IntervalSet <[1.8.1.max, 1.8.max) | [2.0.0-rc.1, inf)>'
+    assert not s.exact  # Y masks still need checking one version at a time
+    s = SpecMask('>1.0 && !=1.5.0')
+    assert repr(s.intervals) == 'IntervalSet <[1.0.max, 1.5.0) | [1.5.0.max, inf)>'
+    assert s.exact
+    assert SpecMask('-Y.0.0').intervals is None
+
+
+def test_interval_set_algebra():
+    a = IntervalSet([((1,), (3,)), ((5,), None)])
+    b = IntervalSet([((2,), (6,))])
+    assert list(a & b) == [((2,), (3,)), ((5,), (6,))]
+    assert list(a | b) == [((1,), None)]
+    assert list(~a) == [(None, (1,)), ((3,), (5,))]
+    assert list(~IntervalSet.everything()) == []
+    assert (2, 0, 0) in a
+    assert (4, 0, 0) not in a
+
+
+def test_version_index_ranges():
+    index = VersionIndex(['2.0.0', '1.0.0', '1.5.0-rc.1', '1.5.0', 'v1.0.0', 'nightly'])
+    assert [v.original_string for v in index] == ['1.0.0', '1.5.0-rc.1', '1.5.0', '2.0.0']
+    assert index.ranges(SpecMask('>=1.5.0 && <2.0.0').intervals) == [(1, 3)]
+
+
+def test_interval_matching_agrees_with_spec_matching():
+    versions = ['0.9.0', '1.0.0-alpha', '1.0.0', '1.0.1', '1.1.0-rc.1', '1.1.0', '1.2.3', '2.0.0-beta', '2.0.0', '3.1.0']
+    masks = ['>1.0.0 && <2.0.0', '<=1.1', '!=1.0.0', '==1.1', '>=1.0.0-alpha || <0.9.5', '~1.0.0', '~=1.1', '1.Y.Y',
+             '>1 || 0.9.0']
+    index = VersionIndex(versions)
+    for mask in masks:
+        for current in [None, '1.0.0', '1.1.0-rc.1']:
+            s = SpecMask(mask, current)
+            assert s.matching_versions(versions) == [v.original_string for v in index if s.match(v)], (mask, current)
+
+
+def test_partial_specs_with_prereleases():
+    # partial versions with a prerelease compare their prerelease whatever the missing parts, so their matches don't
+    # follow version order and they're matched one by one within a superset of intervals
+    versions = ['1.9.0', '2.0.0-alpha', '2.0.0-rc.1', '2.0.0-rc.2', '2.0.0', '2.0.1', '2.1.0', '2.5.0-rc.1', '3.0.0']
+    assert VersionFilter.semver_filter('!=2-rc.1', versions) == [
+        '1.9.0', '2.0.0-alpha', '2.0.0-rc.2', '2.0.0', '2.0.1', '2.1.0', '3.0.0']
+    assert VersionFilter.semver_filter('<2.0-rc.2', versions) == ['1.9.0', '2.0.0-alpha', '2.0.0-rc.1']
+    assert VersionFilter.semver_filter('>=2.0-rc.1', versions) == [
+        '2.0.0-rc.1', '2.0.0-rc.2', '2.0.0', '2.0.1', '2.1.0', '2.5.0-rc.1', '3.0.0']
+    assert VersionFilter.semver_filter('==2-rc.1', versions) == ['2.0.0-rc.1', '2.5.0-rc.1']
+    assert VersionFilter.semver_filter('<=1-rc.1', ['0.9.0', '1.0.0-alpha', '1.2.3']) == ['0.9.0', '1.0.0-alpha']
+    assert VersionFilter.semver_filter('1.0-L', ['1.0.0-alpha.1', '1.0.2'], '0.3.2-alpha.1') == ['1.0.0-alpha.1']
+    assert not SpecMask('<2.0-rc.2').exact
+    for mask in ['!=2-rc.1', '<2.0-rc.2', '>=2.0-rc.1', '<=1-rc.1', '==2-rc.1']:
+        s = SpecMask(mask)
+        assert s.matching_versions(versions) == [v for v in versions if s.match(v)], mask
+
+
+def test_exact_masks_compare_by_intervals():
+    assert SpecMask('>=1.0.0 && <=1.0.0') == SpecMask('1.0.0')
+    assert hash(SpecMask('>=1.0.0 && <=1.0.0')) == hash(SpecMask('1.0.0'))
+    assert SpecMask('>=1.0.0 && <=1.0.0') != SpecMask('1.0.0', '0.1.0')
+
+
+def test_parsed_versions_precompute_sort_keys():
+    v = _parse_semver('v1.2.3-alpha.10')
+    assert v.original_string == 'v1.2.3-alpha.10'
+    assert v.sort_key == (1, 2, 3, (0, (1, 'alpha'), (0, 10)), ())
+    assert _parse_semver('1.2.3-alpha.9').sort_key < v.sort_key < _parse_semver('1.2.3-alpha.beta').sort_key
+    assert _parse_semver('1.2.3-alpha.beta').sort_key < _parse_semver('1.2.3').sort_key
+    assert _parse_semver('1.2').sort_key == (1, 2, 0, (1,), ())
+
+
+def test_prerelease_buckets():
+    versions = ['3.6', '3.6-alpine', '3.6-onbuild', '3.6.1', '3.6.1-alpine', '3.6.1-alpine3.6', '3.7.0-alpine']
+    index = VersionIndex(versions)
+    buckets = index.prerelease_buckets()
+    assert [index[i].original_string for i in buckets[('alpine',)]] == ['3.6-alpine', '3.6.1-alpine', '3.7.0-alpine']
+    assert [index[i].original_string for i in buckets[()]] == ['3.6', '3.6.1']
+
+    s = SpecMask('L.L.Y-L', '3.6-alpine')
+    assert s.prerelease_filter == ('alpine',)
+    assert s.exact
+    assert [index[i].original_string for i in index.positions(s.intervals, s.prerelease_filter)] == ['3.6.1-alpine']
+
+
+def test_prerelease_filters_combine():
+    assert SpecMask('Y.Y.Y').prerelease_filter == ()
+    assert SpecMask('Y.Y.Y-Y').prerelease_filter is None
+    assert SpecMask('Y.Y.Y || Y.Y.Y-Y').prerelease_filter is None
+    assert SpecMask('Y.Y.Y-alpine && Y.Y.Y-Y').prerelease_filter == ('alpine',)
+    assert SpecMask('Y.Y.Y-alpine && Y.Y.Y').matching_versions(['1.0.0', '1.0.0-alpine']) == []
+
+
+def test_compiled_masks_are_immutable():
+    s = compile_mask('L.Y.Y || -Y.Y.0', '1.2.3')
+    with pytest.raises(AttributeError):
+        s.op = SpecMask.AND
+    with pytest.raises(AttributeError):
+        s.specs[0].kind = '<'
+    with pytest.raises(AttributeError):
+        s.specs[0].yes_ver.major = None
+    with pytest.raises(AttributeError):
+        s.intervals.intervals = ()
+    assert isinstance(s.specs, tuple)
+
+    v = _parse_semver('1.2.3')
+    with pytest.raises(AttributeError):
+        v.major = 2
+    with pytest.raises(AttributeError):
+        del v.original_string
+    assert v == Version('1.2.3') and hash(v) == hash(Version('1.2.3'))
+
+
+def test_compiled_masks_shared_between_threads():
+    import threading
+    versions = ['{}.{}.{}'.format(major, minor, patch) for major in range(3) for minor in range(10) for patch in range(5)]
+    masks = ['L.Y.Y', '-Y.Y.0', 'Y.Y.Y || >=2.0.0', '>=1.0.0 && <1.5.0']
+    expected = [VersionFilter.semver_filter(m, versions, '1.2.3') for m in masks]
+    results = []
+
+    def worker():
+        results.append([VersionFilter.semver_filter(m, versions, '1.2.3') for m in masks * 5][:len(masks)])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [expected] * 8
+
+
+def test_serialized_masks():
+    import json
+    import pickle
+    versions = ['1.0.0', '1.2.3', '1.2.4-rc.1', '1.2.4', '1.3.0', '2.0.0']
+    for mask in ['>=1.0.0 && <2.0.0', 'L.L.Y-Y', 'L.Y.Y || -Y.Y.0', '^1.2.3', '* || 1.Y-alpha', '-L1.0.0',
+                 '-L.L.0 || -1.3.L']:
+        s = SpecMask(mask, '1.2.3')
+        data = s.serialize()
+        for loaded in [SpecMask.deserialize(data), SpecMask.deserialize(json.loads(json.dumps(data))),
+                       pickle.loads(pickle.dumps(s))]:
+            assert loaded == s
+            assert loaded.canonical == s.canonical
+            assert loaded.matching_versions(versions) == s.matching_versions(versions)
+            assert loaded.latest_versions(versions, 2) == s.latest_versions(versions, 2)
+            if s.intervals is not None:  # next best masks can't match single versions
+                assert [v in loaded for v in versions] == [v in s for v in versions]
+
+    assert SpecMask('L.L.Y', '1.2.3').serialize() == (1, '1.2.Y', '1.2.3', (((1, 2, 3, None), (1, 2, None)),), ())
+    assert SpecMask.deserialize(SpecMask('L.L.Y', '1.2.3').serialize()).specs == ()
+    assert len(pickle.dumps(SpecMask('>=1.0.0 && <2.0.0'))) < 200
+
+    with pytest.raises(ValueError):
+        SpecMask.deserialize((2, '*', None, None, None))
+
+
+def test_limit_max_fake_versions():
+    versions = ['1.0.0', '1.0.1', '20200101.0.0', '20200101.0.1']
+    with pytest.raises(LimitExceededError):
+        VersionFilter.semver_filter('-Y.Y.Y', ['1.0.0', '1.0.5000000'], limits=Limits(100, None, None, None))
+    with pytest.raises(LimitExceededError):
+        VersionFilter.semver_latest('-Y.Y.Y', versions, limits=Limits(100, None, None, None))
+    assert VersionFilter.semver_filter('-Y.Y.Y', ['1.0.0', '1.0.5'], limits=Limits(100, None, None, None)) == ['1.0.5']
+
+
+def test_next_best_majors_without_versions():
+    # majors and minors within the range of versions but without any version expect nothing
+    assert VersionFilter.semver_filter('-Y.Y.Y', ['0.5.0', '1.0.2', '3.0.0'], '0.1.0') == []
+    assert VersionFilter.semver_filter('-Y.Y.0', ['0.5.1', '2.0.0'], None) == ['0.5.1']
+    assert VersionFilter.semver_filter('-Y.Y.Y', []) == []
+
+
+def test_limit_max_specs():
+    mask = ' || '.join('{}.0.0'.format(i) for i in range(10))
+    limits = Limits(None, 5, None, None)
+    with pytest.raises(LimitExceededError):
+        VersionFilter.semver_filter(mask, ['1.0.0'], limits=limits)
+    assert VersionFilter.semver_filter(mask, ['1.0.0']) == ['1.0.0']
+
+    assert not VersionFilter.semver_validate(mask, limits)
+    assert VersionFilter.semver_validate(mask)
+    diagnostic = VersionFilter.semver_validate_many([mask], limits)[0]
+    assert not diagnostic.valid
+    assert mask[diagnostic.offset:].startswith('|| 5.0.0')
+
+
+def test_limit_max_versions_and_deadline():
+    versions = ['1.0.{}'.format(i) for i in range(2000)]
+    with pytest.raises(LimitExceededError):
+        VersionFilter.semver_filter('Y.Y.Y', versions, limits=Limits(None, None, 1000, None))
+    with pytest.raises(LimitExceededError):
+        VersionFilter.semver_filter('Y.Y.Y', versions, assume_sorted=True, limits=Limits(None, None, 1000, None))
+
+    def slow_versions():
+        import time
+        time.sleep(0.02)
+        for v in versions:
+            yield v
+
+    with pytest.raises(LimitExceededError):
+        VersionFilter.semver_latest('Y.Y.Y', slow_versions(), limits=Limits(None, None, None, 0.01))
+    assert len(VersionFilter.semver_filter('Y.Y.Y', slow_versions(), limits=Limits(None, None, None, 10))) == 2000
+
+
+def test_set_default_limits():
+    previous = set_default_limits()
+    try:
+        assert set_default_limits(max_versions=10).max_versions == 10
+        with pytest.raises(LimitExceededError):
+            VersionFilter.semver_filter('Y.Y.Y', ['1.0.{}'.format(i) for i in range(20)])
+    finally:
+        set_default_limits(**previous._asdict())
+    assert len(VersionFilter.semver_filter('Y.Y.Y', ['1.0.{}'.format(i) for i in range(20)])) == 20
+
+
+def test_semver_filter_output_modes():
+    versions = ['2.0.0', 'v1.1.0', 'junk', '1.0.0', '1.1.0', '3.0.0-rc.1', '1.5.0']
+    assert VersionFilter.semver_filter('Y.Y.Y', versions) == ['1.0.0', 'v1.1.0', '1.5.0', '2.0.0']
+    assert VersionFilter.semver_filter('Y.Y.Y', versions, output=INDICES) == [3, 1, 6, 0]
+    assert VersionFilter.semver_filter('Y.Y.Y', versions, output=INDICES, order=INPUT) == [0, 1, 3, 6]
+    assert VersionFilter.semver_filter('Y.Y.Y', versions, order=INPUT) == ['2.0.0', 'v1.1.0', '1.0.0', '1.5.0']
+    assert VersionFilter.semver_filter('-Y.Y.1', versions, output=INDICES) == [1, 6, 0, 5]
+    assert VersionFilter.semver_latest('Y.Y.Y', versions, n=2, output=INDICES) == [0, 6]
+    assert VersionFilter.semver_latest('Y.Y.Y', sorted(versions[3:]), n=2, output=INDICES, assume_sorted=True) == [2, 1]
+
+    parsed = VersionFilter.semver_filter('Y.Y.Y', versions, output=VERSIONS)
+    assert parsed == [Version('1.0.0'), Version('1.1.0'), Version('1.5.0'), Version('2.0.0')]
+    chained = VersionFilter.semver_filter('1.Y.Y', parsed, output=VERSIONS, assume_sorted=True)
+    assert all(any(v is p for p in parsed) for v in chained)
+    assert VersionFilter.semver_filter('1.Y.Y', parsed) == ['1.0.0', 'v1.1.0', '1.5.0']
+    assert VersionFilter.semver_filter('1.Y.Y', [Version('1.2.0')]) == ['1.2.0']
+
+    with pytest.raises(ValueError):
+        VersionFilter.semver_filter('Y.Y.Y', versions, output='bytes')
+    with pytest.raises(ValueError):
+        VersionFilter.semver_filter('Y.Y.Y', versions, order='reversed')
+
+
+def test_semver_count_and_any():
+    versions = ['1.0.0', '1.0.0', 'v1.1.0', '1.2.0-rc.1', '1.2.0', 'junk', '2.0.0']
+    for mask, current_version in [('Y.Y.Y', None), ('L.Y.Y', '1.0.0'), ('Y.Y.Y-Y', None), ('^1.0.0', None),
+                                  ('-Y.Y.1', None), ('3.Y.Y', None)]:
+        matches = VersionFilter.semver_filter(mask, versions, current_version)
+        assert VersionFilter.semver_count(mask, versions, current_version) == len(matches)
+        assert VersionFilter.semver_count(mask, sorted(set(versions) - {'junk'}, key=_parse_semver),
+                                          current_version, assume_sorted=True) == len(matches)
+        assert VersionFilter.semver_any(mask, versions, current_version) == bool(matches)
+
+
+def test_semver_any_stops_at_first_match():
+    def versions():
+        yield '1.0.0'
+        raise AssertionError('versions after the first match should not be read')
+
+    assert VersionFilter.semver_any('Y.Y.Y', versions())
+
+
+def test_semver_filter_fleet():
+    versions = ['1.0.0', '1.0.1', '1.1.0', '1.2.0-alpha', '2.0.0', '2.0.5', '2.1.0', '3.0.0', 'invalid']
+    current_versions = ['1.0.0', '2.0.0', '1.0.0', '3.0.0', None]
+    for mask in ['Y.Y.Y', 'L.Y.Y', 'L.L.Y', 'L.Y.Y || >=3.0.0', '-L.Y.Y', '^1.0.0', 'L.Y.Y-Y']:
+        fleet = VersionFilter.semver_filter_fleet(mask, versions, [c for c in current_versions if 'L' not in mask or c])
+        for current_version, matches in fleet.items():
+            assert matches == VersionFilter.semver_filter(mask, versions, current_version)
+
+    fleet = VersionFilter.semver_filter_fleet('L.Y.Y', versions, current_versions[:3])
+    assert fleet == {'1.0.0': ['1.0.1', '1.1.0'], '2.0.0': ['2.0.5', '2.1.0']}
+
+    fleet = VersionFilter.semver_filter_fleet('L.Y.Y', versions, ['1.0.0', '2.0.0'], output=INDICES)
+    assert fleet == {'1.0.0': [1, 2], '2.0.0': [5, 6]}
+
+
+def test_semver_filter_fleet_errors():
+    with pytest.raises(ValueError):
+        VersionFilter.semver_filter_fleet('L.Y.Y', ['1.0.0'], ['1.0.0', None])
+    with pytest.raises(ValueError):
+        VersionFilter.semver_filter_fleet('L.Y.Y', ['1.0.0'], ['1.0.0', 'invalid'])
+    assert VersionFilter.semver_filter_fleet('L.Y.Y', ['1.0.0'], []) == {}
+
+
+def test_upgrade_path():
+    versions = ['1.4.0', '1.4.1', '1.5.0', '1.9.2', '1.9.3-rc.1', '2.0.1', '2.3.0', '3.0.0', '3.0.1', '3.1.0-beta.1']
+    steps = ['L.Y.Y', 'L1.0.0', '-L1.0.0']
+    assert VersionFilter.upgrade_path(versions, '1.4.0', steps) == ['1.9.2', '2.0.1', '2.3.0', '3.0.0', '3.0.1']
+    assert VersionFilter.upgrade_path(versions[::-1], '1.4.0', steps) == ['1.9.2', '2.0.1', '2.3.0', '3.0.0', '3.0.1']
+    assert VersionFilter.upgrade_path(versions, '1.4.0', ['L.L.Y', 'L.L1.0']) == ['1.4.1', '1.5.0']
+    assert VersionFilter.upgrade_path(versions, '1.4.0', steps, output=INDICES) == [3, 5, 6, 7, 8]
+    assert VersionFilter.upgrade_path(versions, '3.0.1', steps) == []
+    assert VersionFilter.upgrade_path(versions, '1.4.0', []) == []
+
+    # each step follows on from the previous one like chained semver_filter calls
+    path, current_version = [], '1.4.0'
+    while True:
+        matches = next((m for m in (VersionFilter.semver_filter(s, versions, current_version) for s in steps) if m), [])
+        if not matches:
+            break
+        current_version = matches[-1]
+        path.append(current_version)
+    assert VersionFilter.upgrade_path(versions, '1.4.0', steps) == path
+
+
+def test_upgrade_path_ends_without_greater_versions(monkeypatch):
+    # a step mask matching a version that isn't greater than the previous one ends the path rather than looping
+    versions = ['0.5.0', '1.0.6', '1.5.0']
+    monkeypatch.setattr(SpecMask, '_latest_positions', lambda self, index, n: [0])
+    assert VersionFilter.upgrade_path(versions, '1.2.0', ['Y.Y.Y']) == []
+    assert VersionFilter.upgrade_path(versions, None, ['Y.Y.Y']) == ['0.5.0']
+
+
+def test_upgrade_path_errors():
+    with pytest.raises(ValueError):
+        VersionFilter.upgrade_path(['1.0.0'], None, ['L.Y.Y'])
+    with pytest.raises(ValueError):
+        VersionFilter.upgrade_path(['1.0.0'], '1.0.0', ['bogus'])
+
+
+def test_semver_group_latest():
+    versions = ['1.4.0', '1.4.1', '1.5.0', '1.9.2', '1.9.3-rc.1', '2.0.1', '2.3.0', '3.0.0', '3.0.1', '3.1.0-beta.1']
+    assert list(VersionFilter.semver_group_latest('Y.Y.Y', versions).items()) == [
+        ((1,), ['1.9.2']), ((2,), ['2.3.0']), ((3,), ['3.0.1'])]
+    assert list(VersionFilter.semver_group_latest('L.Y.Y', versions, '1.4.0', MINOR, n=2).items()) == [
+        ((1, 4), ['1.4.1']), ((1, 5), ['1.5.0']), ((1, 9), ['1.9.2'])]
+    assert list(VersionFilter.semver_group_latest('Y.Y.Y-Y', versions, group=MAJOR, n=2).items()) == [
+        ((1,), ['1.9.3-rc.1', '1.9.2']), ((2,), ['2.3.0', '2.0.1']), ((3,), ['3.1.0-beta.1', '3.0.1'])]
+    assert list(VersionFilter.semver_group_latest('Y.Y.Y', versions, '2.0.1', output=INDICES).items()) == [
+        ((2,), [6]), ((3,), [8])]
+    assert VersionFilter.semver_group_latest('Y.Y.Y', versions, '9.0.0') == {}
+
+
+def test_semver_group_latest_next_best():
+    versions = ['1.4.0', '1.5.0', '1.9.2', '2.0.1', '2.3.0']
+    grouped = VersionFilter.semver_group_latest('-Y.Y.0', versions, group=MINOR)
+    assert list(grouped.items()) == [((1, 9), ['1.9.2']), ((2, 0), ['2.0.1']), ((2, 3), ['2.3.0'])]
+    assert sum(grouped.values(), []) == VersionFilter.semver_filter('-Y.Y.0', versions)
+
+
+def test_semver_group_latest_invalid_group():
+    with pytest.raises(ValueError):
+        VersionFilter.semver_group_latest('Y.Y.Y', ['1.0.0'], group='patch')
+
+
+def test_exclusions():
+    versions = ['1.0.0', '1.0.1', '1.1.0-alpha', '1.1.0', '1.2.0', '1.2.1', '2.0.0', '2.0.1+build']
+    specmask = compile_mask('L.Y.Y && !=1.0.1 && !=1.1 && !=2.0.0', '1.0.0')
+    assert [s.canonical for s in specmask.specs] == ['1.Y.Y']
+    assert specmask.exclusions == frozenset([(1, 0, 1), (1, 1), (2, 0, 0)])
+    assert specmask.canonical == '!=1.0.1 && !=1.1 && !=2.0.0 && 1.Y.Y'
+    assert specmask.matching_versions(versions) == ['1.2.0', '1.2.1']
+    assert specmask.excluded(_parse_semver('1.1.0-alpha').sort_key)
+    assert not specmask.excluded(_parse_semver('1.2.0').sort_key)
+
+    assert compile_mask('Y.Y.Y-Y && !=1.1.0 && !=1.2').matching_versions(versions) == [
+        '1.0.0', '1.0.1', '2.0.0', '2.0.1+build']
+    assert compile_mask('!=1.0.1 && !=2.0.0').matching_versions(versions) == [
+        '1.0.0', '1.1.0-alpha', '1.1.0', '1.2.0', '1.2.1', '2.0.1+build']
+
+    # masks without exact intervals, and next best masks
+    assert compile_mask('~1.2 && !=1.2.0').matching_versions(versions) == ['1.2.1']
+    versions = ['1.0.1', '1.1.2', '1.2.1', '2.0.1']
+    assert compile_mask('-Y.Y.0 && !=1.2.1 && !=2.0').matching_versions(versions) == ['1.0.1', '1.1.2']
+    assert VersionFilter.semver_count('-Y.Y.0 && !=1.2.1 && !=2.0', versions) == 2
+
+
+def test_exclusions_partial_prerelease():
+    # != of a partial version with a prerelease isn't a key prefix, it only excludes that prerelease of its major
+    versions = ['1.9.0', '2.0.0-alpha', '2.0.0-rc.1', '2.0.0', '2.1.0', '2.5.0-rc.1', '3.0.0']
+    specmask = compile_mask('Y.Y.Y-Y && !=2-rc.1 && !=3.0.0')
+    assert specmask.exclusions == frozenset([(3, 0, 0)])
+    assert specmask.matching_versions(versions) == ['1.9.0', '2.0.0-alpha', '2.0.0', '2.1.0']
+    assert SpecItemMask('!=2-rc.1').excluded_prefix() is None
+    assert SpecItemMask('!=2.0').excluded_prefix() == (2, 0)
+
+
+def test_exclusions_or_masks_unchanged():
+    specmask = compile_mask('1.Y.Y || !=2.0.0')
+    assert specmask.exclusions == frozenset()
+    assert len(specmask.specs) == 2
+
+
+@pytest.mark.parametrize('mask,current_version', [
+    ('Y.Y.Y', None),
+    ('L.Y.Y', '1.0.0'),
+    ('L.L.Y', '1.2.0'),
+    ('>=1.0.1 && <2.0.0', None),
+    ('^2.0.0', None),
+    ('1.Y.Y || 3.Y.Y-Y', None),
+    ('L.Y.Y && !=1.2.0', '1.0.0'),
+    ('-L.Y.0', '1.0.0'),
+])
+def test_engines(mask, current_version):
+    versions = ['3.0.0-rc.1', 'v1.2.0', '2.0.0', '1.0.1', 'nope', '01.1.0', '1.1.0', Version('2.1.0'), '1.0.0',
+                '=1.2.1', '3.0.0', '2.0.0', '1.2', '\u00b2.0.0', '\u0661.0.0']
+    for output in [INDICES, VERSIONS, None]:
+        for order in [INPUT, None]:
+            kwargs = dict((name, value) for name, value in [('output', output), ('order', order)] if value)
+            expected = VersionFilter.semver_filter(mask, versions, current_version, engine=INDEX, **kwargs)
+            for engine in [AUTO, SCAN, PREFILTER]:
+                assert VersionFilter.semver_filter(mask, versions, current_version, engine=engine,
+                                                   **kwargs) == expected, (engine, output, order)
+
+
+def test_engine_thresholds(monkeypatch):
+    specmask = compile_mask('L.L.Y', '1.2.0')
+    monkeypatch.setattr('version_filter.version_filter._engine_thresholds', None)
+    assert get_engine_thresholds() == {'scan_exact': 32, 'scan_inexact': 0, 'prefilter': 256}
+    assert specmask._choose_engine(['1.2.3'] * 10, False, False) == SCAN
+    assert specmask._choose_engine(['1.2.3'] * 10, True, False) == INDEX
+    assert specmask._choose_engine(['1.2.3'] * 100, False, False) == INDEX
+    assert specmask._choose_engine(['1.2.3'] * 1000, True, False) == PREFILTER
+    assert specmask._choose_engine(['1.2.3'] * 1000, True, True) == INDEX
+    assert specmask._choose_engine(iter(['1.2.3']), False, False) == INDEX
+    assert compile_mask('Y.Y.Y')._choose_engine(['1.2.3'] * 1000, False, False) == INDEX  # every major
+    assert compile_mask('-L.Y.0', '1.0.0')._choose_engine(['1.2.3'], False, False) == INDEX  # next best
+
+    # junk strings are skipped like by the other engines when AUTO picks PREFILTER
+    versions = ['1.{}.0'.format(i) for i in range(300)] + ['\u00b2.0.0']
+    assert VersionFilter.semver_filter('L.Y.Y', versions, '1.0.0') == versions[1:300]
+
+    assert set_engine_thresholds(scan_exact=0)['scan_exact'] == 0
+    assert specmask._choose_engine(['1.2.3'] * 10, False, False) == INDEX
+    with pytest.raises(ValueError):
+        set_engine_thresholds(scan=1)
+
+
+def test_calibration_file(monkeypatch, tmpdir):
+    monkeypatch.setattr('version_filter.version_filter._engine_thresholds', None)
+    path = str(tmpdir.join('calibration.json'))
+    save_calibration(path, {'scan_exact': 8, 'scan_inexact': 4, 'prefilter': 64})
+    assert get_engine_thresholds()['prefilter'] == 256
+    assert load_calibration(path) == {'scan_exact': 8, 'scan_inexact': 4, 'prefilter': 64}
+    assert get_engine_thresholds()['prefilter'] == 64
+
+    # loaded at startup from the environment
+    monkeypatch.setattr('version_filter.version_filter._engine_thresholds', None)
+    monkeypatch.setenv('VERSION_FILTER_CALIBRATION', path)
+    assert get_engine_thresholds() == {'scan_exact': 8, 'scan_inexact': 4, 'prefilter': 64}
+
+
+def test_engines_check_sorted():
+    for engine in [AUTO, SCAN, INDEX, PREFILTER]:
+        with pytest.raises(UnsortedVersionsError):
+            VersionFilter.semver_filter('Y.Y.Y', ['2.0.0', '1.0.0'], assume_sorted=True, check_sorted=True,
+                                        engine=engine)
+        assert VersionFilter.semver_filter('Y.Y.Y', ['1.0.0', '2.0.0'], assume_sorted=True, check_sorted=True,
+                                           engine=engine) == ['1.0.0', '2.0.0']
+
+
+def test_invalid_engine():
+    with pytest.raises(ValueError):
+        VersionFilter.semver_filter('Y.Y.Y', ['1.0.0'], engine='vectorized')
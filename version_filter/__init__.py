@@ -1,7 +1,30 @@
 # -*- coding: utf-8 -*-
-from .version_filter import VersionFilter, SpecMask, SpecItemMask  # noqa: F401
-import pkg_resources
+import sys
+
+from .version_filter import VersionFilter, SpecMask, SpecItemMask, compile_mask  # noqa: F401
 
 __author__ = """Dropseed"""
 __email__ = 'python@dropseed.io'
-__version__ = pkg_resources.get_distribution("version_filter").version
+
+
+def _get_version():
+    """Look up the installed distribution version, importing the metadata machinery only when needed"""
+    try:
+        from importlib.metadata import version
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        return pkg_resources.get_distribution("version_filter").version
+    return version("version_filter")
+
+
+def __getattr__(name):
+    # Module level __getattr__ (PEP 562) keeps the slow distribution lookup off the import path
+    if name == '__version__':
+        value = globals()['__version__'] = _get_version()
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ isn't supported, resolve the version eagerly
+    __version__ = _get_version()
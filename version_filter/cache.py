@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Cache the results of filtering, keyed on the canonical form of the mask, the current version and a fingerprint of
+the versions, so the same question about the same versions is only answered once.
+
+    cache = ResultCache(SQLiteBackend('results.db'))  # or ResultCache() for an in memory cache
+    fingerprint = VersionsFingerprint(versions)
+    cache.semver_filter('L.Y.Y', versions, '1.2.3', fingerprint=fingerprint)
+    ...
+    versions += new_versions
+    fingerprint = fingerprint.extend(new_versions)  # only the new versions are hashed
+
+Results are stored as positions in the given versions, so they only take a few bytes per match whatever the output.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import namedtuple
+
+from .version_filter import (INDICES, SORTED, STRINGS, VERSIONS, VersionFilter, _LRUCache, _check_output, _limited,
+                             _parse_semver, compile_mask)
+
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'hit_rate', 'entries'])
+
+
+class VersionsFingerprint(object):
+    """A fingerprint of a list of versions.  Extending it with versions appended to the list only hashes those, use
+       extend rather than fingerprinting the whole list again."""
+
+    def __init__(self, versions=()):
+        self._hash = hashlib.sha1()
+        self.count = 0
+        self._update(versions)
+
+    def extend(self, versions):
+        """Return the fingerprint of the versions followed by the given versions, this fingerprint is left as is"""
+        fingerprint = VersionsFingerprint.__new__(VersionsFingerprint)
+        fingerprint._hash = self._hash.copy()
+        fingerprint.count = self.count
+        fingerprint._update(versions)
+        return fingerprint
+
+    @property
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def _update(self, versions):
+        # each version is prefixed with its length, so that the boundaries between versions are part of the hash
+        strings = ['{}'.format(v) for v in versions]
+        self._hash.update(''.join('{}:{}'.format(len(s), s) for s in strings).encode('utf-8'))
+        self.count += len(strings)
+
+    def __eq__(self, other):
+        if not isinstance(other, VersionsFingerprint):
+            return NotImplemented
+        return self.count == other.count and self.hexdigest == other.hexdigest
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash((self.count, self.hexdigest))
+
+    def __str__(self):
+        return '{}-{}'.format(self.count, self.hexdigest)
+
+    def __repr__(self):
+        return 'VersionsFingerprint <{}>'.format(self)
+
+
+class MemoryBackend(_LRUCache):
+    """Keep the results in memory, dropping the least recently used ones past maxsize entries"""
+
+    def __init__(self, maxsize=4096):
+        super(MemoryBackend, self).__init__(maxsize)
+
+
+class SQLiteBackend(object):
+    """Keep the results in a SQLite database at path, so they outlive the process.  Past maxsize entries (unlimited
+       by default) the least recently used ones are dropped."""
+
+    def __init__(self, path, maxsize=None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS version_filter_results '
+                                 '(key TEXT PRIMARY KEY, value TEXT NOT NULL, used INTEGER NOT NULL)')
+        self._clock = self._connection.execute('SELECT MAX(used) FROM version_filter_results').fetchone()[0] or 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM version_filter_results WHERE key = ?',
+                                           (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self._clock += 1
+            self._connection.execute('UPDATE version_filter_results SET used = ? WHERE key = ?', (self._clock, key))
+            self.hits += 1
+            return tuple(json.loads(row[0]))
+
+    def setdefault(self, key, value):
+        """Return the value stored for key, storing value first if there is none"""
+        with self._lock:
+            self._clock += 1
+            self._connection.execute('INSERT OR IGNORE INTO version_filter_results VALUES (?, ?, ?)',
+                                     (key, json.dumps(list(value)), self._clock))
+            if self.maxsize is not None:
+                self._connection.execute('DELETE FROM version_filter_results WHERE key IN (SELECT key FROM '
+                                         'version_filter_results ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                                         (self.maxsize,))
+            row = self._connection.execute('SELECT value FROM version_filter_results WHERE key = ?',
+                                           (key,)).fetchone()
+            return tuple(json.loads(row[0])) if row is not None else tuple(value)
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM version_filter_results')
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM version_filter_results').fetchone()[0]
+
+
+class ResultCache(object):
+    """Cache the results of VersionFilter.semver_filter in a backend, a MemoryBackend by default"""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    def semver_filter(self, mask, versions, current_version=None, fingerprint=None, assume_sorted=False,
+                      check_sorted=False, limits=None, output=STRINGS, order=SORTED):
+        """Return what VersionFilter.semver_filter returns, from the cache when the same mask (per its canonical
+           form) and current version were used with the same versions.
+
+        versions must be a list (or another sequence).  Pass the VersionsFingerprint of the versions, kept up to date
+        with VersionsFingerprint.extend as versions are appended, to save hashing every version on each call."""
+        _check_output(output, order)
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+        if fingerprint is None:
+            fingerprint = VersionsFingerprint(versions)
+        elif fingerprint.count != len(versions):
+            raise ValueError('The fingerprint is of {} versions, not {}'.format(fingerprint.count, len(versions)))
+
+        current = '{}'.format(specmask.current_version) if specmask.current_version is not None else None
+        # results with assume_sorted depend on the order of versions, and check_sorted has to raise for unsorted ones
+        key = json.dumps([specmask.canonical, current, '{}'.format(fingerprint), order, assume_sorted, check_sorted])
+        positions = self.backend.get(key)
+        if positions is None:
+            positions = self.backend.setdefault(key, tuple(VersionFilter.semver_filter(
+                mask, versions, current_version, assume_sorted, check_sorted, limits, INDICES, order)))
+
+        if output == INDICES:
+            return list(positions)
+        if output == VERSIONS:
+            return [_parse_semver(versions[i]) for i in positions]
+        # the original string of a version string is the string itself, only other versions need parsing
+        return [versions[i] if isinstance(versions[i], str) else _parse_semver(versions[i]).original_string
+                for i in positions]
+
+    @property
+    def hits(self):
+        return self.backend.hits
+
+    @property
+    def misses(self):
+        return self.backend.misses
+
+    @property
+    def hit_rate(self):
+        """The share of the lookups answered from the cache, 0.0 before any lookup"""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def stats(self):
+        return CacheStats(self.hits, self.misses, self.hit_rate, len(self.backend))
+
+    def clear(self):
+        """Forget every result, and reset the hit and miss counts"""
+        self.backend.clear()
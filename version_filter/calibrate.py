@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Calibrate the thresholds with which VersionFilter.semver_filter picks an engine (engine=AUTO) on this machine:
+
+    python -m version_filter.calibrate --output calibration.json
+    VERSION_FILTER_CALIBRATION=calibration.json python ...
+
+Each engine is timed on synthetic versions of growing sizes: SCAN against INDEX for an exact and an inexact mask (SCAN
+is picked up to the size it last won at before losing), and PREFILTER against INDEX for a mask matching a single major
+(PREFILTER is picked from the smallest size it won at).  The thresholds are printed as JSON, and saved to the --output
+file which is loaded at startup when named by $VERSION_FILTER_CALIBRATION, or with
+version_filter.version_filter.load_calibration.
+"""
+from __future__ import print_function
+import argparse
+import json
+import random
+import sys
+import timeit
+
+from .version_filter import INDEX, PREFILTER, SCAN, VersionFilter, save_calibration
+
+DEFAULT_SIZES = [4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096]
+NEVER = sys.maxsize  # threshold of PREFILTER when it never wins
+
+# (mask, current version) of each comparison, the exact one being matched on intervals alone
+_EXACT_MASK = ('L.Y.Y', '{}.0.0')
+_INEXACT_MASK = ('^{}.0.0', None)
+_MAJOR_MASK = ('L.L.Y', '{}.0.0')
+
+
+def synthetic_versions(size, seed=0):
+    """size distinct version strings over a dozen majors, with a few prereleases, in random order"""
+    rng = random.Random('{}-{}'.format(seed, size))
+    versions = set()
+    while len(versions) < size:
+        version = '{}.{}.{}'.format(rng.randint(0, 11), rng.randint(0, 20), rng.randint(0, 30))
+        if rng.random() < 0.1:
+            version += '-rc.{}'.format(rng.randint(1, 3))
+        versions.add(version)
+    versions = sorted(versions)
+    rng.shuffle(versions)
+    return versions
+
+
+def _time(engine, mask, versions, repeat):
+    mask, current_version = mask
+    current_version = current_version and current_version.format(5)
+    timer = timeit.Timer(lambda: VersionFilter.semver_filter(mask.format(5), versions, current_version, engine=engine))
+    return min(timer.repeat(repeat, 1))
+
+
+def _wins(engine, mask, versions, repeat):
+    return _time(engine, mask, versions, repeat) < _time(INDEX, mask, versions, repeat)
+
+
+def calibrate(sizes=None, repeat=5, seed=0):
+    """Time the engines and return the thresholds of the AUTO engine, see set_engine_thresholds"""
+    sizes = sorted(sizes or DEFAULT_SIZES)
+    thresholds = {'scan_exact': 0, 'scan_inexact': 0, 'prefilter': NEVER}
+    scanning = {'scan_exact': _EXACT_MASK, 'scan_inexact': _INEXACT_MASK}
+    for size in sizes:
+        versions = synthetic_versions(size, seed)
+        for name, mask in list(scanning.items()):
+            if _wins(SCAN, mask, versions, repeat):
+                thresholds[name] = size
+            else:
+                del scanning[name]  # the sizes SCAN is picked for stop at its first loss
+        if thresholds['prefilter'] == NEVER and _wins(PREFILTER, _MAJOR_MASK, versions, repeat):
+            thresholds['prefilter'] = size
+    return thresholds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m version_filter.calibrate', description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of versions to time')
+    parser.add_argument('--repeat', type=int, default=5, help='timings per engine and size, the best one is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic versions')
+    parser.add_argument('--output', help='file to save the thresholds to')
+    args = parser.parse_args(argv)
+
+    if args.repeat < 1 or any(size < 1 for size in args.sizes):
+        print('calibrate: sizes and repeat must be positive', file=sys.stderr)
+        return 2
+    thresholds = calibrate(args.sizes, args.repeat, args.seed)
+    if args.output:
+        save_calibration(args.output, thresholds)
+    print(json.dumps(thresholds, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Command line interface: print the versions matching a mask, one per line.
+
+    version-filter 'L.Y.Y' dump.tsv --current-version 1.2.3 --package requests
+    version-filter 'Y.Y.Y' versions.txt --separator ''  # one version per line
+    cat versions.txt | version-filter '>=1.0.0 && <2.0.0'
+    version-filter --package requests -- '-Y.Y.0' dump.tsv  # -- before masks starting with a '-'
+
+Files are memory mapped and read as records of a package and a version (see version_filter.ingest), standard input is
+read as one version per line.
+"""
+from __future__ import print_function
+import argparse
+import codecs
+import sys
+
+from .ingest import filter_dump
+from .version_filter import LimitExceededError, VersionFilter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='version-filter', description=__doc__.splitlines()[0])
+    parser.add_argument('mask', help='the mask to filter the versions with')
+    parser.add_argument('path', nargs='?', default='-', help='dump to read, standard input by default')
+    parser.add_argument('-c', '--current-version', default=None, help='current version, for masks with LOCKs')
+    parser.add_argument('-p', '--package', default=None, help='only the records of this package')
+    parser.add_argument('-s', '--separator', default='\\t',
+                        help='separator between the package and the version (backslash escapes allowed, default '
+                             '\\t), an empty one when records are versions')
+    parser.add_argument('-n', '--latest', type=int, default=None, help='only the N newest matches, newest first')
+    args = parser.parse_args(argv)
+
+    separator = codecs.decode(args.separator, 'unicode_escape') or None
+    try:
+        if args.path == '-':
+            versions = [line.strip() for line in sys.stdin if line.strip()]
+            matches = VersionFilter.semver_filter(args.mask, versions, args.current_version)
+        else:
+            matches = filter_dump(args.path, args.mask, args.current_version, args.package, separator)
+    except (LimitExceededError, ValueError) as e:
+        print('version-filter: {}'.format(e), file=sys.stderr)
+        return 2
+
+    if args.latest is not None:
+        matches = matches[::-1][:args.latest]
+    for version in matches:
+        print(version)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
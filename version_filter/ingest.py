@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Filter the versions of large dumps of newline delimited records without reading them into lists first.
+
+Dumps are memory mapped, and each record is a package and a version separated by a separator (a tab by default):
+
+    requests\t2.18.4
+    requests\t2.19.0
+    six\t1.11.0
+
+When a package is given, its records are found by searching the mapped file for the package name, so the records of
+other packages never become Python objects.  Records are screened on the major their version bytes start with before
+being decoded, so that masks bounding the majors only decode and parse the records of those majors.  Only the matching
+versions are kept in memory, except for masks with next best specs which need every version of the package.
+"""
+from __future__ import unicode_literals
+import mmap
+
+from .version_filter import (InvalidSemverError, _limited, _limited_versions, _may_be_in_majors, _parse_semver,
+                             compile_mask)
+
+
+def iter_dump_versions(path, package=None, separator='\t', majors=None):
+    """Yield the version strings of the records of the dump at path, only those of package if given.  With a
+       separator of None every line is a version.  majors (see SpecMask._majors) skips the records of other majors
+       without decoding them."""
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files can't be mapped
+            return
+        try:
+            for version in _iter_records(mapped, package, separator):
+                if majors is None or _may_be_in_majors(version, majors):
+                    yield version.decode('utf-8')
+        finally:
+            mapped.close()
+
+
+def _iter_records(mapped, package, separator):
+    """Yield the versions of the records of a mapped dump, as bytes"""
+    separator = separator.encode('utf-8') if separator is not None else None
+    end = len(mapped)
+    if package is not None:
+        if separator is None:
+            raise ValueError('A separator is needed to find the records of a package')
+        # jump from one record of the package to the next, the file is only scanned by mmap.find
+        needle = package.encode('utf-8') + separator
+
+        def next_record(after):
+            found = mapped.find(b'\n' + needle, after)
+            return -1 if found == -1 else found + 1
+
+        start = 0 if mapped[:len(needle)] == needle else next_record(0)
+        while start != -1:
+            line_end = mapped.find(b'\n', start)
+            line_end = end if line_end == -1 else line_end
+            version = mapped[start + len(needle):line_end].strip()
+            if version:
+                yield version
+            start = next_record(line_end)
+        return
+
+    start = 0
+    while start < end:
+        line_end = mapped.find(b'\n', start)
+        line_end = end if line_end == -1 else line_end
+        if separator is None:
+            version = mapped[start:line_end]
+        else:
+            split = mapped.find(separator, start, line_end)
+            version = mapped[split + len(separator):line_end] if split != -1 else b''
+        version = version.strip()
+        if version:
+            yield version
+        start = line_end + 1
+
+
+_SEEN_SIZE = 65536
+
+
+def filter_dump(path, mask, current_version=None, package=None, separator='\t', limits=None):
+    """Return the sorted (ascending) versions of the dump at path (see iter_dump_versions) that are greater than the
+       current version and that match the mask, like VersionFilter.semver_filter"""
+    with _limited(limits):
+        specmask = compile_mask(mask, current_version)
+        if specmask.intervals is None:
+            # next best matches depend on the whole set of versions
+            return specmask.matching_versions(iter_dump_versions(path, package, separator))
+
+        versions = iter_dump_versions(path, package, separator, specmask._majors)
+        matches = {}
+        seen = {}  # the same version strings come up over and over in dumps, remember the recent ones
+        for version in _limited_versions(versions):
+            if version in seen:
+                continue
+            if len(seen) >= _SEEN_SIZE:
+                seen.clear()
+            seen[version] = True
+            try:
+                v = _parse_semver(version)
+            except InvalidSemverError:
+                continue  # skip invalid semver strings
+            except ValueError:
+                continue  # skip invalid semver strings
+            if specmask._match_parsed(v):
+                matches.setdefault(v, v)
+        return [v.original_string for v in sorted(matches, key=lambda v: v.sort_key)]
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""Load test: replay a mix of filter requests from concurrent callers, and report latency percentiles, throughput and
+cache hit rates (Python 3.6+).
+
+    python -m version_filter.loadtest --requests 20000 --workers 8 --executor process
+    python -m version_filter.loadtest --mix 'L.Y.Y:50' 'Y.Y.Y-Y:1' --result-cache --json
+
+Requests are drawn from synthetic packages whose popularity follows a Zipf distribution, so a few packages get most of
+the requests like on a real registry.  Each request filters the versions of a package with a mask of the mix, picked
+according to the weights of the mix, and one of the package's versions as the current version.  The same seed replays
+the same requests.
+
+Latencies are measured around each call in the workers, throughput over the whole run.  Cache hit rates are those of
+the compiled masks cache, and of a ResultCache (see version_filter.cache) per worker process with --result-cache.
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import timeit
+try:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+except ImportError:  # Python 2
+    ProcessPoolExecutor = ThreadPoolExecutor = None
+
+from .cache import ResultCache, VersionsFingerprint
+from .version_filter import VersionFilter, _compiled_masks
+
+DEFAULT_MIX = ['L.Y.Y:40', 'L.L.Y:30', 'Y.Y.Y:15', 'Y.Y.Y-Y:10', '-L.L.Y:5']
+PERCENTILES = [('p50', 0.5), ('p99', 0.99), ('p999', 0.999)]
+_BATCH_SIZE = 50
+
+_state = {}  # the corpus and caches of this process, set up by _init_worker
+
+
+def parse_mix(entries):
+    """Parse mask:weight entries (the weight defaults to 1) into a list of (mask, weight), raising ValueError for
+       invalid masks or weights"""
+    mix = []
+    for entry in entries:
+        mask, _, weight = entry.rpartition(':')
+        if not mask:
+            mask, weight = weight, '1'
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise ValueError('Invalid weight in mix entry {!r}'.format(entry))
+        if weight < 0:
+            raise ValueError('Negative weight in mix entry {!r}'.format(entry))
+        if not VersionFilter.semver_validate(mask):
+            raise ValueError('Invalid mask in mix entry {!r}'.format(entry))
+        mix.append((mask, weight))
+    if not mix or not sum(weight for _, weight in mix):
+        raise ValueError('The mix needs at least one mask with a positive weight')
+    return mix
+
+
+def package_versions(seed, package, max_versions):
+    """The version strings of a synthetic package, in ascending order with about one prerelease per minor"""
+    rng = random.Random('{}-{}'.format(seed, package))
+    count = rng.randint(min(10, max_versions), max_versions)
+    versions = []
+    major = minor = patch = 0
+    while len(versions) < count:
+        versions.append('{}.{}.{}'.format(major, minor, patch))
+        step = rng.random()
+        if step < 0.05:
+            major, minor, patch = major + 1, 0, 0
+            versions.append('{}.0.0-rc.1'.format(major))
+        elif step < 0.25:
+            minor, patch = minor + 1, 0
+            versions.append('{}.{}.0-beta.1'.format(major, minor))
+        else:
+            patch += 1
+    return versions[:count]
+
+
+def _check_python():
+    if ThreadPoolExecutor is None or not hasattr(random.Random, 'choices'):
+        raise RuntimeError('The load test needs Python 3.6 or later')
+
+
+def generate_requests(count, packages, mix, zipf=1.1, seed=0, max_versions=300):
+    """Return count (package, mask, current version) requests"""
+    _check_python()
+    rng = random.Random(seed)
+    package_weights = [1 / (rank + 1) ** zipf for rank in range(packages)]
+    masks = [mask for mask, _ in mix]
+    mask_weights = [weight for _, weight in mix]
+    requests = []
+    versions = {}
+    chosen = rng.choices(range(packages), package_weights, k=count)
+    for package, mask in zip(chosen, rng.choices(masks, mask_weights, k=count)):
+        if package not in versions:
+            versions[package] = package_versions(seed, package, max_versions)
+        requests.append((package, mask, rng.choice(versions[package])))
+    return requests
+
+
+def _init_worker(seed, max_versions, result_cache):
+    if _state.get('pid') == os.getpid():
+        return  # threads share the state of their process, forked processes start over
+    _compiled_masks.clear()
+    _state.update(pid=os.getpid(), config=(seed, max_versions, result_cache), corpus={},
+                  cache=ResultCache() if result_cache else None)
+
+
+def _corpus(package):
+    """The versions of a package and their fingerprint, generated the first time they're needed"""
+    corpus = _state['corpus']
+    if package not in corpus:
+        seed, max_versions, _ = _state['config']
+        versions = package_versions(seed, package, max_versions)
+        corpus.setdefault(package, (versions, VersionsFingerprint(versions)))
+    return corpus[package]
+
+
+def _counters():
+    counters = {'compiled masks': (_compiled_masks.hits, _compiled_masks.misses)}
+    if _state.get('cache') is not None:
+        counters['results'] = (_state['cache'].hits, _state['cache'].misses)
+    return counters
+
+
+def _run_batch(batch):
+    """Run a batch of requests, returning their latencies, errors, and the cache counters of this process"""
+    cache = _state['cache']
+    latencies = []
+    errors = 0
+    for package, mask, current_version in batch:
+        versions, fingerprint = _corpus(package)
+        start = timeit.default_timer()
+        try:
+            if cache is not None:
+                cache.semver_filter(mask, versions, current_version, fingerprint=fingerprint)
+            else:
+                VersionFilter.semver_filter(mask, versions, current_version)
+        except ValueError:
+            errors += 1
+        latencies.append(timeit.default_timer() - start)
+    return latencies, errors, os.getpid(), _counters()
+
+
+def percentile(latencies, q):
+    """Nearest rank percentile of sorted latencies"""
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, max(0, int(math.ceil(q * len(latencies))) - 1))]
+
+
+def run(requests=10000, workers=4, executor='thread', packages=200, max_versions=300, mix=None, zipf=1.1, seed=0,
+        result_cache=False):
+    """Run a load test, returning its report as a dict"""
+    mix = parse_mix(mix or DEFAULT_MIX)
+    if executor not in ('thread', 'process'):
+        raise ValueError('executor must be thread or process, not {!r}'.format(executor))
+    work = generate_requests(requests, packages, mix, zipf, seed, max_versions)
+    batches = [work[i:i + _BATCH_SIZE] for i in range(0, len(work), _BATCH_SIZE)]
+
+    pool_class = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    initargs = (seed, max_versions, result_cache)
+    _state.clear()
+    if executor == 'thread':
+        _init_worker(*initargs)
+    latencies = []
+    errors = 0
+    counters = {}  # pid -> cache name -> (hits, misses), the latest of each process
+    start = timeit.default_timer()
+    with pool_class(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        for batch_latencies, batch_errors, pid, batch_counters in pool.map(_run_batch, batches):
+            latencies.extend(batch_latencies)
+            errors += batch_errors
+            process = counters.setdefault(pid, {})
+            for name, (hits, misses) in batch_counters.items():
+                previous = process.get(name, (0, 0))
+                process[name] = (max(hits, previous[0]), max(misses, previous[1]))
+    elapsed = timeit.default_timer() - start
+    if executor == 'thread':
+        counters = {os.getpid(): _counters()}
+
+    latencies.sort()
+    latency = dict((name, percentile(latencies, q)) for name, q in PERCENTILES)
+    latency['mean'] = sum(latencies) / len(latencies) if latencies else 0.0
+    latency['max'] = latencies[-1] if latencies else 0.0
+    report = {
+        'executor': executor,
+        'workers': workers,
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'latency': latency,
+        'caches': {},
+    }
+    for process in counters.values():
+        for name, (hits, misses) in process.items():
+            total = report['caches'].setdefault(name, {'hits': 0, 'misses': 0})
+            total['hits'] += hits
+            total['misses'] += misses
+    for total in report['caches'].values():
+        lookups = total['hits'] + total['misses']
+        total['hit_rate'] = total['hits'] / lookups if lookups else 0.0
+    return report
+
+
+def format_report(report):
+    lines = ['{requests} requests, {errors} errors, {workers} {executor} workers: {seconds:.2f}s, '
+             '{throughput:,.1f} requests/s'.format(**report),
+             'latency ms: ' + ', '.join('{} {:.3f}'.format(name, report['latency'][name] * 1000)
+                                        for name in [name for name, _ in PERCENTILES] + ['mean', 'max'])]
+    for name, total in sorted(report['caches'].items()):
+        lines.append('{} cache: {:.1%} hit rate ({} hits, {} misses)'.format(name, total['hit_rate'], total['hits'],
+                                                                             total['misses']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m version_filter.loadtest', description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10000, help='number of requests to replay')
+    parser.add_argument('--workers', type=int, default=4, help='number of concurrent workers')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread', help='kind of worker pool')
+    parser.add_argument('--packages', type=int, default=200, help='number of synthetic packages')
+    parser.add_argument('--versions', type=int, default=300, help='maximum number of versions of a package')
+    parser.add_argument('--mix', nargs='+', default=DEFAULT_MIX, help='masks and their weights, as mask:weight')
+    parser.add_argument('--zipf', type=float, default=1.1, help='skew of the popularity of the packages')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated requests')
+    parser.add_argument('--result-cache', action='store_true', help='cache results with a ResultCache per process')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        report = run(args.requests, args.workers, args.executor, args.packages, args.versions, args.mix, args.zipf,
+                     args.seed, args.result_cache)
+    except (ValueError, RuntimeError) as e:
+        print('loadtest: {}'.format(e), file=sys.stderr)
+        return 2
+    print(json.dumps(report, indent=2, sort_keys=True) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Parsed version tables in shared memory, so that worker processes filter the same versions without each holding a
+parsed copy of them.
+
+One process publishes the versions, and the others attach to the table by its name:
+
+    table = SharedVersionTable.publish(versions)
+    ...
+    table = SharedVersionTable.attach(name)  # in the workers
+    table.filter('L.Y.Y', current_version='1.2.3')
+
+The table is columnar: the major, minor and patch numbers, an id of the prerelease and build of each version, and the
+offsets of the version strings, all in ascending version order.  Masks that compile into exact intervals are
+evaluated with binary searches of those columns, only the other masks parse the versions they have to look at.
+"""
+import json
+import struct
+from array import array
+
+from .version_filter import VersionIndex, _limited, _parse_semver, _prerelease_key, compile_mask
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+_published = set()  # names of the shared memory blocks published by this process
+
+_MAGIC = b'VFTABLE1'
+_HEADER = struct.Struct('<8sQQQ')  # magic, number of versions, length of the tags, length of the strings
+_COLUMNS = 5  # major, minor, patch, tag (prerelease and build) id, and string offset columns, 8 bytes per version
+
+
+class SharedVersionTable(VersionIndex):
+    """A VersionIndex whose columns live in a multiprocessing.shared_memory block.
+
+    Use SharedVersionTable.publish to create one, and SharedVersionTable.attach to open it from other processes.  The
+    process that published it unlinks it once every process is done with it, see close and unlink."""
+
+    def __init__(self, shm):
+        if shm.buf[:len(_MAGIC)].tobytes() != _MAGIC:
+            raise ValueError('{} is not a shared version table'.format(shm.name))
+        self._prerelease_buckets = None
+        self._shm = shm
+        _, count, tags_length, strings_length = _HEADER.unpack_from(shm.buf)
+        columns = shm.buf[_HEADER.size:_HEADER.size + 8 * (_COLUMNS * count + 1)].cast('q')
+        self._columns = columns
+        self._major = columns[:count]
+        self._minor = columns[count:2 * count]
+        self._patch = columns[2 * count:3 * count]
+        self._tag = columns[3 * count:4 * count]
+        self._offsets = columns[4 * count:]
+        start = _HEADER.size + columns.nbytes
+        self._tags = [(tuple(prerelease), tuple(build))
+                      for prerelease, build in json.loads(shm.buf[start:start + tags_length].tobytes().decode('utf-8'))]
+        self._tag_keys = [_prerelease_key(prerelease) for prerelease, _ in self._tags]
+        start += tags_length
+        self._strings = shm.buf[start:start + strings_length]
+        self.keys = _Column(self._key, count)
+        self.versions = _Column(lambda i: _parse_semver(self.string(i)), count)
+
+    @classmethod
+    def publish(cls, versions, name=None):
+        """Parse a list of version strings, sort them and publish them in a new shared memory block, named name or
+           a random name.  Invalid semver strings are silently skipped."""
+        if shared_memory is None:
+            raise RuntimeError('Shared version tables need Python 3.8 or later')
+
+        index = VersionIndex(versions)
+        major, minor, patch, tag, offsets = (array('q') for _ in range(_COLUMNS))
+        tag_ids = {}
+        strings = bytearray()
+        offsets.append(0)
+        for v in index:
+            major.append(v.major)
+            minor.append(v.minor)
+            patch.append(v.patch)
+            tag.append(tag_ids.setdefault((v.prerelease or (), v.build or ()), len(tag_ids)))
+            strings += v.original_string.encode('utf-8')
+            offsets.append(len(strings))
+        tags = json.dumps(sorted(tag_ids, key=tag_ids.get)).encode('utf-8')
+
+        columns = b''.join(column.tobytes() for column in [major, minor, patch, tag, offsets])
+        size = _HEADER.size + len(columns) + len(tags) + len(strings)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        try:
+            _HEADER.pack_into(shm.buf, 0, _MAGIC, len(index), len(tags), len(strings))
+            start = _HEADER.size
+            for data in [columns, tags, bytes(strings)]:
+                shm.buf[start:start + len(data)] = data
+                start += len(data)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        _published.add(shm._name)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        """Open the table published under name"""
+        if shared_memory is None:
+            raise RuntimeError('Shared version tables need Python 3.8 or later')
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13
+            shm = shared_memory.SharedMemory(name=name)
+            if shm._name not in _published:
+                # only the publishing process is in charge of unlinking the block, otherwise the resource tracker of
+                # the first attached process to exit would unlink it
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def string(self, i):
+        """The version string at position i, as it was given to publish"""
+        return self._strings[self._offsets[i]:self._offsets[i + 1]].tobytes().decode('utf-8')
+
+    def filter(self, mask, current_version=None, limits=None):
+        """Return the sorted (ascending) version strings of the table matching the mask, see
+           VersionFilter.semver_filter"""
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            return [self.string(i) for i in specmask._matching_positions(self)]
+
+    def latest(self, mask, current_version=None, n=1, limits=None):
+        """Return up to n of the newest version strings of the table matching the mask, newest first, see
+           VersionFilter.semver_latest"""
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            return [self.string(i) for i in specmask._latest_positions(self, n)]
+
+    def count_matching(self, mask, current_version=None, limits=None):
+        """Return how many versions of the table match the mask, see VersionFilter.semver_count"""
+        with _limited(limits):
+            return compile_mask(mask, current_version)._count_positions(self)
+
+    def any_matching(self, mask, current_version=None, limits=None):
+        """Return whether any version of the table matches the mask, see VersionFilter.semver_any"""
+        with _limited(limits):
+            return compile_mask(mask, current_version)._any_position(self)
+
+    def count(self, intervals, prerelease=None):
+        if prerelease is None:
+            return super(SharedVersionTable, self).count(intervals)
+        return len(self.positions(intervals, prerelease))
+
+    def positions(self, intervals, prerelease=None):
+        if prerelease is None:
+            return super(SharedVersionTable, self).positions(intervals)
+        # tag ids are compared rather than building the prerelease buckets in every process
+        wanted = set(i for i, (tag_prerelease, _) in enumerate(self._tags) if tag_prerelease == prerelease)
+        tag = self._tag
+        return [i for start, stop in self.ranges(intervals) for i in range(start, stop) if tag[i] in wanted]
+
+    def prerelease_buckets(self):
+        if self._prerelease_buckets is None:
+            buckets = {}
+            for i, tag in enumerate(self._tag):
+                buckets.setdefault(self._tags[tag][0], []).append(i)
+            self._prerelease_buckets = buckets
+        return self._prerelease_buckets
+
+    def close(self):
+        """Stop using the table in this process"""
+        for view in [self._major, self._minor, self._patch, self._tag, self._offsets, self._columns, self._strings]:
+            view.release()
+        self._shm.close()
+
+    def unlink(self):
+        """Free the shared memory block, once every process closed the table"""
+        self._shm.unlink()
+        _published.discard(self._shm._name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key(self, i):
+        tag = self._tag[i]
+        return self._major[i], self._minor[i], self._patch[i], self._tag_keys[tag], self._tags[tag][1]
+
+
+class _Column(object):
+    """A read only sequence computing its items from their position"""
+
+    def __init__(self, item, length):
+        self._item = item
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return self._item(i)
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._item(i)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Compile masks into SQL predicates over a table of versions with integer major, minor and patch columns, so that the
+database does the filtering with its indexes instead of every row being read into Python:
+
+    query = compile_sql('L.Y.Y', '1.2.3', prerelease='prerelease')
+    rows = connection.execute('SELECT version FROM versions WHERE {} ORDER BY {}'.format(query.where, query.order_by),
+                              query.params)
+    versions = query.post_filter([version for version, in rows])
+
+The predicate is built from the intervals of the compiled mask (see SpecMask.intervals).  When it selects exactly the
+matching rows query.exact is True, otherwise (prereleases in the bounds of the intervals, masks without exact
+intervals, next best masks) it selects a superset of them.  query.post_filter narrows the selected versions down to
+what VersionFilter.semver_filter returns, in semver order, and is needed unless query.exact.
+
+Releases are expected to have an empty or NULL prerelease column, prereleases their dot separated identifiers
+(e.g. rc.1).  Column names are put into the SQL as is, they must be trusted identifiers.
+"""
+from collections import namedtuple
+
+from .version_filter import _MAX, _limited, compile_mask
+
+SQLQuery = namedtuple('SQLQuery', ['where', 'params', 'order_by', 'exact', 'post_filter'])
+
+
+def compile_sql(mask, current_version=None, major='major', minor='minor', patch='patch', prerelease=None,
+                placeholder='?', limits=None):
+    """Return an SQLQuery for the versions matching the mask and greater than the current version, over the given
+       columns.  Without a prerelease column the prerelease conditions of the mask are left to the post filter.
+       placeholder is the parameter placeholder of the database driver, e.g. %s for the format paramstyle."""
+    with _limited(limits):
+        specmask = compile_mask(mask, current_version)
+
+    def post_filter(versions):
+        with _limited(limits):
+            return specmask.matching_versions(versions)
+
+    order_by = ', '.join([major, minor, patch])
+    if specmask.intervals is None:
+        # next best matches depend on every version
+        return SQLQuery('1 = 1', (), order_by, False, post_filter)
+
+    builder = _Builder([major, minor, patch], placeholder)
+    where = builder.intervals(specmask.intervals)
+    prerelease_filter = specmask.prerelease_filter
+    if prerelease_filter is False:
+        where = '1 = 0'
+    elif prerelease_filter is not None:
+        if prerelease is None:
+            builder.exact = False
+        elif prerelease_filter == ():
+            where = '({}) AND ({} IS NULL OR {} = {})'.format(where, prerelease, prerelease, placeholder)
+            builder.params.append('')
+        else:
+            where = '({}) AND {} = {}'.format(where, prerelease, placeholder)
+            builder.params.append('.'.join(prerelease_filter))
+    return SQLQuery(where, tuple(builder.params), order_by, builder.exact and specmask.exact, post_filter)
+
+
+def filter_sqlite(connection, table, mask, current_version=None, version='version', major='major', minor='minor',
+                  patch='patch', prerelease=None, limits=None):
+    """Return the sorted (ascending) versions of the version column of a table of an sqlite3 connection that match the
+       mask, like VersionFilter.semver_filter, with only the rows selected by compile_sql read from the database"""
+    query = compile_sql(mask, current_version, major, minor, patch, prerelease, limits=limits)
+    sql = 'SELECT {} FROM {} WHERE {} ORDER BY {}'.format(version, table, query.where, query.order_by)
+    rows = connection.execute(sql, query.params)
+    return query.post_filter([row[0] for row in rows])
+
+
+class _Builder(object):
+    """Builds the predicate of an IntervalSet, collecting its parameters, and whether it is exact"""
+
+    def __init__(self, columns, placeholder):
+        self.columns = columns
+        self.placeholder = placeholder
+        self.params = []
+        self.exact = True
+
+    def intervals(self, intervals):
+        predicates = []
+        for lo, hi in intervals:
+            conditions = [c for c in [self.bound(lo, lower=True), self.bound(hi, lower=False)] if c]
+            predicates.append(' AND '.join(conditions) or '1 = 1')
+        if not predicates:
+            return '1 = 0'
+        if len(predicates) == 1:
+            return predicates[0]
+        return ' OR '.join('({})'.format(p) for p in predicates)
+
+    def bound(self, key, lower):
+        """The condition of the versions on the right side of a bound, or None if there is none.  Keys are compared
+           on their major, minor and patch prefix, a _MAX after it makes the comparison strict (or inclusive for
+           upper bounds).  Bounds within the prereleases of a patch include the whole patch and aren't exact."""
+        if key is None:
+            return None
+        prefix = tuple(x for x in key[:3] if isinstance(x, int))
+        rest = key[len(prefix):]
+        after = rest == (_MAX,)
+        if rest and not after:
+            self.exact = False
+            after = not lower
+        if not prefix:
+            return None if lower != after else '1 = 0'
+        if lower:
+            return self.compare(prefix, '>' if after else '>=')
+        return self.compare(prefix, '<=' if after else '<')
+
+    def compare(self, values, op):
+        """Lexicographic comparison of the leading columns to values, with a plain range on the first column so that
+           indexes on it are used"""
+        columns = self.columns[:len(values)]
+        strict = op[0]
+        if len(values) == 1:
+            self.params.append(values[0])
+            return '{} {} {}'.format(columns[0], op, self.placeholder)
+
+        def nested(i):
+            if i == len(values) - 1:
+                self.params.append(values[i])
+                return '{} {} {}'.format(columns[i], op, self.placeholder)
+            self.params.extend([values[i], values[i]])
+            return '({} {} {} OR ({} = {} AND {}))'.format(
+                columns[i], strict, self.placeholder, columns[i], self.placeholder, nested(i + 1))
+
+        self.params.append(values[0])
+        return '{} {}= {} AND {}'.format(columns[0], strict, self.placeholder, nested(0))
@@ -1,30 +1,327 @@
 from __future__ import unicode_literals
-from builtins import str
+import bisect
+import heapq
+import json
+import os
+from array import array
 import re
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 import semantic_version
 
+try:
+    str = unicode  # noqa: F821  Python 2, treat all text as unicode
+except NameError:
+    pass
+
 
 class InvalidSemverError(ValueError):
     pass
 
 
+class UnsortedVersionsError(ValueError):
+    pass
+
+
+class LimitExceededError(ValueError):
+    pass
+
+
+# Limits on the work a single call does, None for no limit:
+#   max_fake_versions: versions a next best mask may expect to exist, e.g. '-Y.Y.Y' with majors 1 and 20200101
+#   max_specs: specs per mask, the items between its || or && operators
+#   max_versions: versions given to a call
+#   deadline: seconds a call may take
+Limits = namedtuple('Limits', ['max_fake_versions', 'max_specs', 'max_versions', 'deadline'])
+
+_default_limits = Limits(max_fake_versions=1000000, max_specs=256, max_versions=None, deadline=None)
+_call_limits = threading.local()  # limits and deadline of the calls in progress, per thread
+_monotonic = getattr(time, 'monotonic', time.time)  # Python 2 has no monotonic clock
+
+
+def set_default_limits(**limits):
+    """Change the default Limits of every call, returning them.  Pass None to lift a limit."""
+    global _default_limits
+    _default_limits = _default_limits._replace(**limits)
+    return _default_limits
+
+
+@contextmanager
+def _limited(limits=None):
+    """Apply limits, or the default ones, to the calls made within the context"""
+    limits = limits or _default_limits
+    previous = getattr(_call_limits, 'limits', None), getattr(_call_limits, 'deadline', None)
+    _call_limits.limits = limits
+    _call_limits.deadline = None if limits.deadline is None else _monotonic() + limits.deadline
+    try:
+        yield limits
+    finally:
+        _call_limits.limits, _call_limits.deadline = previous
+
+
+def _active_limits():
+    return getattr(_call_limits, 'limits', None) or _default_limits
+
+
+def _check_deadline():
+    deadline = getattr(_call_limits, 'deadline', None)
+    if deadline is not None and _monotonic() > deadline:
+        raise LimitExceededError('Deadline of {}s exceeded'.format(_active_limits().deadline))
+
+
+def _check_spec_count(mask, limits):
+    """Raise LimitExceededError if the mask has more specs than the limits allow"""
+    if limits.max_specs is not None:
+        specs = mask.count(SpecMask.OR) + mask.count(SpecMask.AND) + 1
+        if specs > limits.max_specs:
+            raise LimitExceededError('Mask has {} specs, more than the limit of {}'.format(specs, limits.max_specs))
+
+
+def _limited_versions(versions):
+    """Iterate over versions, enforcing the max_versions limit and the deadline of the call in progress"""
+    max_versions = _active_limits().max_versions
+    for count, version in enumerate(versions):
+        if not count & 0x3ff:
+            _check_deadline()
+        if max_versions is not None and count >= max_versions:
+            raise LimitExceededError('More than the limit of {} versions'.format(max_versions))
+        yield version
+
+
+# What filtering returns: the version strings, their parsed Versions or their indices in the given versions
+STRINGS = 'strings'
+VERSIONS = 'versions'
+INDICES = 'indices'
+# The order of the results: ascending semver order or the order of the given versions
+SORTED = 'sorted'
+INPUT = 'input'
+
+
+# How semver_filter finds the matches, see _choose_engine:
+AUTO = 'auto'  # pick one of the others from the number of versions and the shape of the mask
+SCAN = 'scan'  # match the versions one by one, only sorting the matches (masks with intervals)
+INDEX = 'index'  # sort every version into a VersionIndex, and look the matches up with binary searches
+PREFILTER = 'prefilter'  # skip the versions of majors the mask can't match from their strings alone, index the rest
+
+# Number of versions from which (PREFILTER) or up to which (SCAN) an engine is picked, see version_filter.calibrate
+_DEFAULT_ENGINE_THRESHOLDS = {'scan_exact': 32, 'scan_inexact': 0, 'prefilter': 256}
+_engine_thresholds = None  # loaded on first use, from the file named by $VERSION_FILTER_CALIBRATION if any
+CALIBRATION_ENVIRONMENT_VARIABLE = 'VERSION_FILTER_CALIBRATION'
+
+
+def set_engine_thresholds(**thresholds):
+    """Change the thresholds of the AUTO engine (see version_filter.calibrate), returning them"""
+    global _engine_thresholds
+    unknown = set(thresholds) - set(_DEFAULT_ENGINE_THRESHOLDS)
+    if unknown:
+        raise ValueError('Unknown engine thresholds: {}'.format(', '.join(sorted(unknown))))
+    updated = dict(get_engine_thresholds())
+    updated.update(thresholds)
+    _engine_thresholds = updated
+    return updated
+
+
+def get_engine_thresholds():
+    global _engine_thresholds
+    if _engine_thresholds is None:
+        path = os.environ.get(CALIBRATION_ENVIRONMENT_VARIABLE)
+        _engine_thresholds = _read_calibration(path) if path else dict(_DEFAULT_ENGINE_THRESHOLDS)
+    return _engine_thresholds
+
+
+def save_calibration(path, thresholds=None):
+    """Save engine thresholds (the current ones by default) to a JSON file"""
+    with open(path, 'w') as f:
+        json.dump({'thresholds': thresholds or get_engine_thresholds()}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_calibration(path):
+    """Use the engine thresholds saved in a file by save_calibration, returning them"""
+    return set_engine_thresholds(**_read_calibration(path))
+
+
+def _read_calibration(path):
+    with open(path) as f:
+        thresholds = json.load(f)['thresholds']
+    calibration = dict(_DEFAULT_ENGINE_THRESHOLDS)
+    calibration.update((name, int(value)) for name, value in thresholds.items() if name in calibration)
+    return calibration
+
+
+def _check_engine(engine):
+    if engine not in (AUTO, SCAN, INDEX, PREFILTER):
+        raise ValueError('engine must be one of {}, {}, {} or {}, not {!r}'.format(
+            AUTO, SCAN, INDEX, PREFILTER, engine))
+
+
+# How versions are grouped: by major, or by major and minor
+MAJOR = 'major'
+MINOR = 'minor'
+
+
+def _check_output(output, order=SORTED):
+    if output not in (STRINGS, VERSIONS, INDICES):
+        raise ValueError('output must be one of {}, {} or {}, not {!r}'.format(STRINGS, VERSIONS, INDICES, output))
+    if order not in (SORTED, INPUT):
+        raise ValueError('order must be {} or {}, not {!r}'.format(SORTED, INPUT, order))
+
+
 class VersionFilter(object):
 
     @staticmethod
-    def semver_filter(mask, versions, current_version=None):
-        """Return a list of versions that are greater than the current version and that match the mask"""
-        current = _parse_semver(current_version) if current_version else None
-        specmask = SpecMask(mask, current)
-        return specmask.matching_versions(versions)
+    def semver_filter(mask, versions, current_version=None, assume_sorted=False, check_sorted=False, limits=None,
+                      output=STRINGS, order=SORTED, engine=AUTO):
+        """Return a list of versions that are greater than the current version and that match the mask
+
+        If the versions are already in ascending semver order pass assume_sorted=True to skip sorting them, and
+        check_sorted=True to have that order verified (raising UnsortedVersionsError) as the versions are parsed.
+        limits (see Limits, the defaults are set with set_default_limits) bound the work done, LimitExceededError
+        is raised as soon as one of them is exceeded.
+
+        output selects what the list holds: the version strings (STRINGS), their parsed Versions (VERSIONS, they can
+        be filtered again without parsing them) or their indices in versions (INDICES).  The list is in ascending
+        semver order (SORTED), or in the order of versions (INPUT).  Duplicate versions only appear once, as their
+        first occurrence in versions.
+
+        engine forces how the matches are found (SCAN, INDEX or PREFILTER, when the mask allows it, INDEX with
+        check_sorted), by default (AUTO) it is picked from the number of versions and the shape of the mask, see
+        version_filter.calibrate."""
+        _check_output(output, order)
+        _check_engine(engine)
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            return specmask.matching_versions(versions, assume_sorted, check_sorted, output, order, engine)
 
     @staticmethod
-    def semver_validate(mask):
-        """Returns True if the given mask is valid syntactically, False otherwise"""
-        try:
-            specmask = SpecMask(mask, validate_only=True)
-        except (InvalidSemverError, ValueError) as e:
-            return False
-        return True  # all mask exceptions are raised by instantiation
+    def semver_latest(mask, versions, current_version=None, n=1, assume_sorted=False, check_sorted=False,
+                      limits=None, output=STRINGS):
+        """Return up to n of the newest versions that are greater than the current version and that match the mask,
+           newest first.  Uses heap selection rather than sorting every match, or a walk down from the newest
+           version when the versions are already sorted.  See semver_filter for output."""
+        _check_output(output)
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            return specmask.latest_versions(versions, n, assume_sorted, check_sorted, output)
+
+    @staticmethod
+    def semver_group_latest(mask, versions, current_version=None, group=MAJOR, n=1, assume_sorted=False,
+                            check_sorted=False, limits=None, output=STRINGS):
+        """Return up to n of the newest versions that are greater than the current version and that match the mask
+           for each major (group=MAJOR) or each major and minor (group=MINOR) they belong to, as an OrderedDict of
+           (major,) or (major, minor) tuples to the versions, newest first, the groups in ascending order.
+
+        The mask is applied once, including next best masks, and its matches grouped in one pass.  See semver_filter
+        for output."""
+        _check_output(output)
+        if group not in (MAJOR, MINOR):
+            raise ValueError('group must be {} or {}, not {!r}'.format(MAJOR, MINOR, group))
+        depth = 1 if group == MAJOR else 2
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            index = VersionIndex(versions, assume_sorted, check_sorted)
+            keys = index.keys
+            groups = []  # (group, positions), newest group first
+            for i in reversed(list(specmask._matching_positions(index))):
+                key = tuple(keys[i][:depth])
+                if not groups or groups[-1][0] != key:
+                    groups.append((key, []))
+                if len(groups[-1][1]) < n:
+                    groups[-1][1].append(i)
+            return OrderedDict((key, index.results(positions, output)) for key, positions in reversed(groups))
+
+    @staticmethod
+    def upgrade_path(versions, current_version, step_masks, assume_sorted=False, check_sorted=False, limits=None,
+                     output=STRINGS):
+        """Return the versions of a stepwise upgrade from the current version, in order.  Each step goes to the
+           newest version matching the first of the step masks that has a match, with the LOCKs of the masks
+           relative to the version the previous step went to, until none of the masks has a match.
+
+        e.g. with the step masks ['L.Y.Y', 'L1.0.0', '-L1.0.0'] an upgrade from 1.4.0 goes to the newest 1.x version,
+        then to 2.0.0 (or the next best version if there is no 2.0.0), then to the newest 2.x version, and so on.
+
+        The versions are parsed and sorted once, each step then only costs binary searches for masks with exact
+        intervals.  See semver_filter for output."""
+        _check_output(output)
+        with _limited(limits):
+            index = VersionIndex(versions, assume_sorted, check_sorted)
+            current = _parse_semver(current_version) if current_version else None
+            path = []
+            while True:
+                _check_deadline()
+                for mask in step_masks:
+                    latest = compile_mask(mask, current)._latest_positions(index, 1)
+                    if latest:
+                        break
+                else:
+                    return index.results(path, output)
+                if current is not None and index.keys[latest[0]] <= current.sort_key:
+                    # steps only ever go to greater versions, so that the path ends, stop if a mask doesn't
+                    return index.results(path, output)
+                path.append(latest[0])
+                current = index[latest[0]]
+
+    @staticmethod
+    def semver_filter_fleet(mask, versions, current_versions, assume_sorted=False, check_sorted=False, limits=None,
+                            output=STRINGS):
+        """Filter versions with one mask for many current versions at once, returning a dict of each current version to
+           what semver_filter would return for it.  The versions are parsed and sorted once, and each distinct
+           current version is only evaluated once: equal current versions share the same result list.
+
+        For masks with exact intervals the LOCKs are substituted into a mask without a current version, compiled once
+        for all the current versions substituting the same way, and only narrowed down to the versions newer than
+        each current version."""
+        _check_output(output)
+        with _limited(limits):
+            index = VersionIndex(versions, assume_sorted, check_sorted)
+            bound = {}
+            results = {}
+            for current_version in current_versions:
+                current = _parse_semver(current_version) if current_version else None
+                if current not in bound:
+                    bound[current] = index.results(_fleet_positions(mask, current, index), output)
+                results[current_version] = bound[current]
+            return results
+
+    @staticmethod
+    def semver_count(mask, versions, current_version=None, assume_sorted=False, check_sorted=False, limits=None):
+        """Return how many versions semver_filter would return, without building that list.  Counts come from the
+           sizes of the mask's ranges of versions when it has exact intervals."""
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            return specmask.count_matching(versions, assume_sorted, check_sorted)
+
+    @staticmethod
+    def semver_any(mask, versions, current_version=None, limits=None):
+        """Return whether semver_filter would return any version.  Stops at the first match, unless the mask has next
+           best specs which depend on every version."""
+        with _limited(limits):
+            specmask = compile_mask(mask, current_version)
+            return specmask.any_matching(versions)
+
+    @staticmethod
+    def semver_validate(mask, limits=None):
+        """Returns True if the given mask is valid syntactically and within the limits, False otherwise"""
+        return _validate_mask(mask, limits or _default_limits).valid
+
+    @staticmethod
+    def semver_validate_many(masks, limits=None):
+        """Validate many masks at once, returning a MaskDiagnostic(mask, valid, offset, reason) for each of them.
+           For invalid masks offset is the position in the mask of the item (or operator) at fault."""
+        limits = limits or _default_limits
+        diagnostics = {}
+        results = []
+        for mask in masks:
+            try:
+                diagnostic = diagnostics[mask]
+            except KeyError:
+                diagnostic = diagnostics[mask] = _validate_mask(mask, limits)
+            except TypeError:  # unhashable
+                diagnostic = _validate_mask(mask, limits)
+            results.append(diagnostic)
+        return results
 
     @staticmethod
     def regex_filter(regex_str, versions):
@@ -33,6 +330,23 @@ class VersionFilter(object):
         return [v for v in versions if regex.search(v)]
 
 
+class _Immutable(object):
+    """Instances can't be modified once frozen, which their __init__ does last, so they can be shared between threads"""
+
+    def _freeze(self):
+        object.__setattr__(self, '_frozen', True)
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError('{} objects are immutable'.format(type(self).__name__))
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError('{} objects are immutable'.format(type(self).__name__))
+        object.__delattr__(self, name)
+
+
 class Component(object):
     lock_re = re.compile(r'L|L[0-9]+')
     lockint_re = re.compile(r'L([0-9]+)')
@@ -147,12 +461,28 @@ class SemverComponents(object):
         return SemverComponents(major, minor, patch, other)
 
 
-class SpecItemMask(object):
+def _substitute_locks(version, current_version):
+    """Return the version of a SpecItemMask with its LOCKs substituted, but its YESes still in the string"""
+    mask_components = SemverComponents.parse(version)  # our own parsing attempt
+
+    if not str(mask_components) == version:  # round trip to a string to sanity check
+        raise ValueError('{} was unable to be parsed'.format(version))
+
+    parseable_version = mask_components.substitute_yes().substitute_lock(current_version)
+
+    # another sanity check to make sure it is a valid version string
+    _parse_semver(str(parseable_version))
+
+    return str(mask_components.substitute_lock(current_version))
+
+
+class SpecItemMask(_Immutable):
     MAJOR = 0
     MINOR = 1
     PATCH = 2
     YES = 'Y'
     LOCK = 'L'
+    KIND_ALIASES = {'': '==', '=': '=='}
 
     re_specitemmask = re.compile(r'^(<|<=||=|==|>=|>|!=|\^|~|~=)([0-9LY].*)$')
 
@@ -167,16 +497,33 @@ class SpecItemMask(object):
 
         self.kind = None
         self.version = None
+        self.canonical = None
 
         self.parse(specitemmask)  # sets kind and version attributes
         self.spec = self.get_spec()
+        self._newer_than_current = self.get_newer_than_current()
+        self.prerelease_filter = self.yes_ver.prerelease_filter() if self.has_yes else None
+        self.intervals, self.exact = self.compile_intervals()
+        self._freeze()
 
     def __unicode__(self):
         return "SpecItemMask <{} -> >"
 
     def __repr__(self):
-        rep = ('-' if self.has_next_best else '') + self.kind + self.version
-        return "SpecItemMask <{}>".format(rep)
+        return "SpecItemMask <{}>".format(self.canonical)
+
+    def __eq__(self, other):
+        if not isinstance(other, SpecItemMask):
+            return NotImplemented
+
+        return self.canonical == other.canonical and self.current_version == other.current_version
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self.canonical, self.current_version))
 
     def handle_yes_parsing(self):
         if self.YES in self.version:
@@ -194,23 +541,13 @@ class SpecItemMask(object):
                 raise ValueError('Without a current_version, SpecItemMask objects with LOCKs '
                                  'cannot be converted to Specs')
 
-            mask_components = SemverComponents.parse(self.version)  # our own parsing attempt
-
-            if not str(mask_components) == self.version:  # round trip to a string to sanity check
-                raise ValueError('{} was unable to be parsed'.format(self.version))
-
-            parseable_version = mask_components.substitute_yes().substitute_lock(self.current_version)
-
-            # another sanity check to make sure it is a valid version string
-            _parse_semver(str(parseable_version))
-
-            # finally save the version string with locks substituted, but yeses still in the string
-            self.version = str(mask_components.substitute_lock(self.current_version))
+            self.version = _substitute_locks(self.version, self.current_version)
 
     def parse(self, specitemmask):
         if specitemmask.strip() == '*':
             self.kind = '*'
             self.version = ''
+            self.canonical = '*'
             return
 
         if specitemmask.startswith('-'):
@@ -223,6 +560,15 @@ class SpecItemMask(object):
 
         self.kind, self.version = match.groups()
         self.handle_lock_parsing()
+
+        # canonical form of the mask: locks substituted, kind aliases resolved, and no kind at all for YES masks and
+        # next best masks as their kind is ignored when matching (and next best masks only parse without one)
+        if self.YES in self.version or self.has_next_best:
+            canonical = self.version
+        else:
+            canonical = self.KIND_ALIASES.get(self.kind, self.kind) + self.version
+        self.canonical = ('-' if self.has_next_best else '') + canonical
+
         self.handle_yes_parsing()
 
         if self.has_next_best and self.kind not in ['', '*']:
@@ -239,6 +585,9 @@ class SpecItemMask(object):
             return spec_match and version in self.yes_ver
 
     def newer_than_current(self):
+        return self._newer_than_current
+
+    def get_newer_than_current(self):
         if self.current_version:
             newer_than_current = semantic_version.Spec('>{}'.format(self.current_version))
         else:
@@ -246,32 +595,69 @@ class SpecItemMask(object):
 
         return newer_than_current
 
+    def compile_intervals(self):
+        """Compile the mask into an IntervalSet of version keys, returning it along with whether it is exact.  When it
+           isn't exact the versions in the intervals are only candidates, they still need to be matched one by one.
+           Next best masks depend on which versions exist, they have no intervals."""
+        if self.has_next_best:
+            return None, False
+        if self.has_yes:
+            return self.yes_ver.intervals()
+        return _spec_intervals(self.spec)
+
     def matching_versions(self, versions):
         if not self.has_next_best:
             return [v for v in versions if v in self]
         else:
             return [v for v in self.next_best_matches(versions) if v in self.newer_than_current()]
 
-    def next_best_matches(self, versions):
-        if not self.has_yes:
-            # specs with a lock or hard coded numbers can only result in a single fake version
-            fake_version = _parse_semver(str(self.version), makefake=True)
-            if fake_version not in versions:
-                versions.add(fake_version)
+    def matching_bits(self, versions):
+        """Given a sorted list of versions, return the matches as a bitset: an int with bit i set if versions[i]
+           matches"""
+        if not self.has_next_best:
+            if isinstance(versions, VersionIndex):
+                # the intervals of the spec alone, limited here to the versions newer than the current version
+                newer_intervals, newer_exact = _spec_intervals(self.newer_than_current())
+                positions = versions.positions(self.intervals & newer_intervals, self.prerelease_filter)
+                if not (self.exact and newer_exact):
+                    positions = [i for i in positions if versions[i] in self]
+            else:
+                positions = [i for i, v in enumerate(versions) if v in self]
         else:
-            # versions with a YES require generating all the possible valid fake versions
-            fake_versions = self.yes_ver.get_next_best_versions(versions)
+            newer_than_current = self.newer_than_current()
+            positions = [i for i in self.next_best_positions(versions) if versions[i] in newer_than_current]
+        return _bits_from_positions(positions, len(versions))
 
-            # combine fake and real versions into one set
-            versions = set(versions).union(set(fake_versions))
+    def next_best_matches(self, versions):
+        """Given a sorted list of versions, return the sorted list of the real versions that directly follow each
+           version the mask anticipates but that was never released"""
+        return [versions[i] for i in self.next_best_positions(versions)]
 
-        # For each fake version in the sorted list, get the next real version if it exists
-        versions = sorted(versions)
-        matched_versions = []
-        for i, v in enumerate(versions):
-            if hasattr(v, 'is_fake') and ((i + 1) < len(versions)):
-                matched_versions.append(versions[i + 1])
-        return matched_versions
+    def next_best_positions(self, versions):
+        """Same as next_best_matches, but returns the positions of the matches in versions.  Neither the mask nor
+           versions are modified, the expected versions are looked up with a binary search of versions."""
+        if not self.has_yes:
+            # specs with a lock or hard coded numbers can only result in a single expected version
+            expected = _parse_semver(str(self.version))
+            i = bisect.bisect_left(versions, expected)
+            if i == len(versions) or versions[i] == expected:
+                return []  # the expected version exists, or nothing was released after it
+            return [i]
+
+        # versions with a YES require generating all the possible valid fake versions
+        fake_versions = sorted(self.yes_ver.get_next_best_versions(set(versions)))
+
+        # For each fake version get the next real version if it exists, consecutive fake versions share the same
+        # next real version.  Fakes are sorted so each search can start where the previous one ended.
+        positions = []
+        i = 0
+        for fake in fake_versions:
+            i = bisect.bisect_right(versions, fake, i)
+            if i == len(versions):
+                break
+            if not positions or positions[-1] != i:
+                positions.append(i)
+        return positions
 
     def __contains__(self, item):
         return self.match(item)
@@ -279,21 +665,44 @@ class SpecItemMask(object):
     def get_spec(self):
         return semantic_version.Spec("{}{}".format(self.kind, self.version))
 
+    def excluded_prefix(self):
+        """The key prefix of the versions a != spec excludes (every other version matches it), None for other specs
+           and for != specs whose prefix isn't exact, e.g. !=2-rc.1 (see _partial_prefix_is_exact)"""
+        if self.kind != '!=' or not self.exact or self.prerelease_filter is not None:
+            return None
+        if not all(_partial_prefix_is_exact(item.spec) for item in self.spec.specs):
+            return None
+        intervals = list(self.intervals)
+        if len(intervals) != 2 or intervals[0][1] is None:
+            return None
+        (lo, prefix), (after, hi) = intervals
+        if lo is None and hi is None and after == prefix + (_MAX,):
+            return prefix
+        return None
 
-class SpecMask(object):
+
+class SpecMask(_Immutable):
     AND = "&&"
     OR = "||"
 
     def __init__(self, specmask, current_version=None, validate_only=False):
         self.speckmask = specmask
         self.validate_only = validate_only
-        self.current_version = current_version
+        self.current_version = _parse_semver(current_version) if current_version else None
         if self.validate_only and not current_version:
             # If we're only validating, we'll make an arbitrary current version to handle masks with LOCKs
-            self.current_version = '1.1.1'
+            self.current_version = _parse_semver('1.1.1')
         self.specs = None
         self.op = None
+        self.canonical = None
+        self.exclusions = frozenset()
+        self._exclusion_lengths = ()
+        self.intervals = None
+        self.exact = False
+        self.prerelease_filter = None
+        self._majors = None
         self.parse(specmask)
+        self._freeze()
 
     def parse(self, specmask):
         if self.OR in specmask and self.AND in specmask:
@@ -309,41 +718,253 @@ class SpecMask(object):
             self.op = self.AND
             self.specs = [specmask.strip(), ]
 
-        self.specs = [SpecItemMask(s, self.current_version) for s in self.specs]
-
-    def match(self, version):
-        v = _parse_semver(version)
-
+        self.specs = tuple(SpecItemMask(s, self.current_version) for s in self.specs)
+        self.canonical = self.canonicalize()
+        if self.canonical == '*':
+            # anything OR'd with everything is everything, keeping the other specs would only make matching slower
+            self.specs = tuple(s for s in self.specs if s.canonical == '*')[:1]
         if self.op == self.AND:
-            return all([v in x for x in self.specs])
-        else:
-            return any([v in x for x in self.specs])
+            self.specs, self.exclusions = self.split_exclusions(self.specs)
+            self._exclusion_lengths = tuple(sorted(set(len(prefix) for prefix in self.exclusions)))
+        self.prerelease_filter = self.combine_prerelease_filters()
+        self.intervals, self.exact = self.compile_intervals()
+        self._majors = _major_ranges(self.intervals)
 
-    def matching_versions(self, versions):
-        """Given a list of version, return the sorted (ascending) subset that match the mask"""
-        valid_versions = set()
-        for i, version in enumerate(versions):
+    @staticmethod
+    def split_exclusions(specs):
+        """Split the != specs of an AND mask (e.g. yanked versions) off the other specs, into the set of the key
+           prefixes of the versions they exclude.  A run of them is then checked with set lookups, or removed from
+           the intervals all at once, rather than one spec after the other.  At least one spec is kept."""
+        kept = []
+        exclusions = set()
+        for s in specs:
+            prefix = s.excluded_prefix()
+            if prefix is None:
+                kept.append(s)
+            else:
+                exclusions.add(prefix)
+        return tuple(kept or specs[:1]), frozenset(exclusions)
+
+    def excluded(self, key):
+        """Whether a version key is excluded by the != specs of the mask"""
+        return any(key[:length] in self.exclusions for length in self._exclusion_lengths)
+
+    def excluded_intervals(self):
+        """The IntervalSet of the versions excluded by the != specs of the mask"""
+        return IntervalSet((prefix, prefix + (_MAX,)) for prefix in self.exclusions)
+
+    def combine_prerelease_filters(self):
+        """The prerelease filter (see YesVersion.prerelease_filter) every matching version passes, False if no
+           version can"""
+        filters = set(s.prerelease_filter for s in self.specs)
+        if self.op == self.OR:
+            return filters.pop() if len(filters) == 1 else None
+        filters.discard(None)
+        if len(filters) > 1:
+            return False  # versions can't have two different prereleases
+        return filters.pop() if filters else None
+
+    def compile_intervals(self):
+        """Compile the mask into an IntervalSet of version keys, && and || becoming intersection and union of the
+           intervals of each spec, limited to the versions newer than the current version.  Returns it along with
+           whether it is exact, or (None, False) for masks with next best specs."""
+        if any(s.has_next_best for s in self.specs):
+            return None, False
+
+        intervals = self.specs[0].intervals
+        for s in self.specs[1:]:
+            intervals = intervals & s.intervals if self.op == self.AND else intervals | s.intervals
+        if self.exclusions:
+            intervals = intervals & ~self.excluded_intervals()
+        newer_intervals, newer_exact = _spec_intervals(self.specs[0].newer_than_current())
+        exact = newer_exact and all(s.exact for s in self.specs)
+        if self.op == self.OR and len(set(s.prerelease_filter for s in self.specs)) > 1:
+            exact = False  # the union of the intervals doesn't know which prerelease filter applies where
+        if self.prerelease_filter is False:
+            return IntervalSet(), True
+        return intervals & newer_intervals, exact
+
+    def canonicalize(self):
+        """Return the canonical form of the mask, equivalent masks have the same canonical form: a sorted, de-duplicated
+           list of canonical SpecItemMasks"""
+        items = set(s.canonical for s in self.specs)
+        if len(items) > 1 and '*' in items:
+            if self.op == self.OR:
+                return '*'  # anything OR'd with everything is everything
+            items.discard('*')  # everything AND'd with anything is that thing
+        op = self.op if len(items) > 1 else self.AND
+        return ' {} '.format(op).join(sorted(items))
+
+    def match(self, version):
+        return self._match_parsed(_parse_semver(version))
+
+    def matching_versions(self, versions, assume_sorted=False, check_sorted=False, output=STRINGS, order=SORTED,
+                          engine=AUTO):
+        """Given a list of version, return the sorted (ascending) subset that match the mask.  See
+           VersionFilter.semver_filter for output, order and engine."""
+        if engine == AUTO:
+            engine = self._choose_engine(versions, assume_sorted, check_sorted)
+        if engine == SCAN and self.intervals is not None and not check_sorted:
+            return self._scan(versions, output, order)
+
+        input_positions = None
+        if engine == PREFILTER and self._majors is not None and not check_sorted:
+            versions, input_positions = self._prefilter(versions)
+        index = VersionIndex(versions, assume_sorted, check_sorted)
+        positions = self._matching_positions(index)
+        if order == INPUT:
+            positions = sorted(positions, key=index.input_positions.__getitem__)
+        if input_positions is not None and output == INDICES:
+            return [input_positions[index.input_positions[i]] for i in positions]
+        return index.results(positions, output)
+
+    def _choose_engine(self, versions, assume_sorted, check_sorted):
+        """The engine for the versions: next best masks need every version sorted, a few versions are matched one by
+           one, and many versions are prefiltered by their major when the mask only matches some majors"""
+        if self.intervals is None or check_sorted or not hasattr(versions, '__len__'):
+            return INDEX
+        thresholds = get_engine_thresholds()
+        size = len(versions)
+        if self._majors is not None and size >= thresholds['prefilter']:
+            return PREFILTER
+        if not assume_sorted and size <= thresholds['scan_exact' if self.exact else 'scan_inexact']:
+            return SCAN
+        return INDEX
+
+    def _scan(self, versions, output, order):
+        """Match the versions one by one, only sorting the matches"""
+        matches = [(v, i) for v, i in _parse_versions(versions).items() if self._match_parsed(v)]
+        matches.sort(key=(lambda x: x[0].sort_key) if order == SORTED else (lambda x: x[1]))
+        if output == INDICES:
+            return [i for _, i in matches]
+        if output == VERSIONS:
+            return [v for v, _ in matches]
+        return [v.original_string for v, _ in matches]
+
+    def _prefilter(self, versions):
+        """The versions that may match the mask judging by the major of their strings, along with their positions in
+           versions.  Strings not starting with a number, and objects other than strings, are kept for parsing."""
+        majors = self._majors
+        candidates = []
+        positions = []
+        for i, version in enumerate(_limited_versions(versions)):
+            if isinstance(version, str) and not _may_be_in_majors(version, majors):
+                continue
+            candidates.append(version)
+            positions.append(i)
+        return candidates, positions
+
+    def latest_versions(self, versions, n=1, assume_sorted=False, check_sorted=False, output=STRINGS):
+        """Given a list of version, return up to n of the newest versions that match the mask, newest first"""
+        if self.intervals is None or assume_sorted:
+            index = VersionIndex(versions, assume_sorted, check_sorted)
+            return index.results(self._latest_positions(index, n), output)
+
+        candidates = ((v, i) for v, i in _parse_versions(versions).items() if self._match_parsed(v))
+        latest = heapq.nlargest(n, candidates, key=lambda x: x[0].sort_key)
+        if output == INDICES:
+            return [i for _, i in latest]
+        if output == VERSIONS:
+            return [v for v, _ in latest]
+        return [v.original_string for v, _ in latest]
+
+    def count_matching(self, versions, assume_sorted=False, check_sorted=False):
+        """Given a list of version, return how many of them (duplicates aside) match the mask"""
+        if self.intervals is None or assume_sorted:
+            return self._count_positions(VersionIndex(versions, assume_sorted, check_sorted))
+        return sum(1 for v in _parse_versions(versions) if self._match_parsed(v))
+
+    def any_matching(self, versions):
+        """Given a list of version, return whether any of them match the mask, parsing them only up to the first
+           match"""
+        if self.intervals is None:
+            return self._any_position(VersionIndex(versions))
+        for version in _limited_versions(versions):
             try:
                 v = _parse_semver(version)
-                valid_versions.add(v)
             except InvalidSemverError:
                 continue  # skip invalid semver strings
             except ValueError:
                 continue  # skip invalid semver strings
-
-        versions_sets = []
-        for s in self.specs:
-            versions_sets.append(set(s.matching_versions(valid_versions)))
-
-        matched_versions = set(versions_sets[0])  # Need to initialize with something for later intersection to work
+            if self._match_parsed(v):
+                return True
+        return False
+
+    def _count_positions(self, index):
+        """Given a VersionIndex, return how many of its versions match the mask"""
+        if self.intervals is None:
+            return bin(self._matching_bits(index)).count('1')
+        if self.exact:
+            return index.count(self.intervals, self.prerelease_filter)
+        return len(self._matching_positions(index))
+
+    def _any_position(self, index):
+        """Given a VersionIndex, return whether any of its versions match the mask"""
+        if self.intervals is None:
+            return self._matching_bits(index) != 0
+        if self.exact:
+            return index.count(self.intervals, self.prerelease_filter) > 0
+        return any(self._match_parsed(index[i]) for i in index.positions(self.intervals, self.prerelease_filter))
+
+    def _latest_positions(self, index, n):
+        """Given a VersionIndex, return up to n of the descending positions of the newest versions matching the mask"""
+        if self.intervals is None:
+            # next best matches depend on the whole set of versions, they can't be checked one version at a time
+            candidates = _iter_bits(self._matching_bits(index), reverse=True)
+        else:
+            # walk down the mask's intervals from the newest version, stopping as soon as we have enough matches
+            candidates = index.reversed_positions(self.intervals, self.prerelease_filter)
+            if not self.exact:
+                candidates = (i for i in candidates if self._match_parsed(index[i]))
+        latest = []
+        for i in candidates:
+            if len(latest) >= n:
+                break
+            latest.append(i)
+        return latest
+
+    def _match_parsed(self, v):
+        if self.exact:
+            return _version_key(v) in self.intervals and _prerelease_passes(v, self.prerelease_filter)
         if self.op == self.AND:
-            for v_set in versions_sets:
-                matched_versions = matched_versions.intersection(v_set)
+            if self.exclusions and (self.excluded(_version_key(v)) or v not in self.specs[0].newer_than_current()):
+                return False  # what the != specs would say, they come first
+            return all(v in x for x in self.specs)
         else:
-            for v_set in versions_sets:
-                matched_versions = matched_versions.union(v_set)
+            return any(v in x for x in self.specs)
+
+    def _matching_positions(self, index):
+        """Given a VersionIndex, return the ascending positions of the versions that match the mask.  Only the
+           versions within the mask's intervals are looked at, and only checked one by one if those aren't exact."""
+        if self.intervals is None:
+            return _iter_bits(self._matching_bits(index))
+
+        positions = index.positions(self.intervals, self.prerelease_filter)
+        if self.exact:
+            return positions
+        return [i for i in positions if self._match_parsed(index[i])]
+
+    def _matching_bits(self, valid_versions):
+        """Given a sorted list of unique versions, return a bitset of the positions that match the mask.  Each spec
+           results in a bitset over the same positions, so combining them is a single bitwise operation."""
+        matched_bits = self.specs[0].matching_bits(valid_versions)
+        for s in self.specs[1:]:
+            _check_deadline()
+            if self.op == self.AND:
+                if not matched_bits:
+                    break
+                matched_bits &= s.matching_bits(valid_versions)
+            else:
+                matched_bits |= s.matching_bits(valid_versions)
 
-        return [v.original_string for v in sorted(matched_versions)]
+        if self.exclusions and matched_bits:
+            # the excluded versions are found with binary searches, and cleared with a single bitwise operation
+            if isinstance(valid_versions, VersionIndex):
+                excluded = valid_versions.positions(self.excluded_intervals())
+            else:
+                excluded = [i for i, v in enumerate(valid_versions) if self.excluded(_version_key(v))]
+            matched_bits &= ~_bits_from_positions(excluded, len(valid_versions))
+        return matched_bits
 
     def __contains__(self, item):
         return self.match(item)
@@ -352,15 +973,245 @@ class SpecMask(object):
         if not isinstance(other, SpecMask):
             return NotImplemented
 
-        return set(self.specs) == set(other.specs)
+        return self._equality_key() == other._equality_key()
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self._equality_key())
+
+    def _equality_key(self):
+        # exact masks are equal when they match the same versions, e.g. '>=1.0.0 && <=1.0.0' and '1.0.0'
+        if self.exact:
+            return self.intervals, self.prerelease_filter, self.current_version
+        return self.canonical, self.current_version
 
     def __str__(self):
-        return "SpecMask <{}".format(self.op.join(self.specs))
+        return "SpecMask <{}>".format(self.canonical)
+
+    __repr__ = __str__
+
+    def serialize(self):
+        """Return the compiled mask as a small tuple of plain values (strings, numbers, tuples and None) that
+           SpecMask.deserialize turns back into an equal SpecMask, e.g. to send it to other processes or store it.
 
+        Exact masks are stored as their intervals and prerelease filter and are loaded without parsing anything.
+        Other masks are stored as their canonical form, which is parsed again when loading."""
+        intervals = None
+        if self.exact:
+            intervals = tuple((_encode_key(lo), _encode_key(hi)) for lo, hi in self.intervals)
+        current_version = '{}'.format(self.current_version) if self.current_version else None
+        return _SERIALIZED_MASK_FORMAT, self.canonical, current_version, intervals, self.prerelease_filter
 
-class YesVersionComponent(object):
+    @classmethod
+    def deserialize(cls, data):
+        """Load a SpecMask from SpecMask.serialize.  Lists are accepted in place of tuples, so the serialized form
+           survives a round trip through JSON.  Masks loaded from their intervals have no specs."""
+        data = _tuplify(data)
+        if len(data) != 5 or data[0] != _SERIALIZED_MASK_FORMAT:
+            raise ValueError('Unsupported serialized SpecMask: {!r}'.format(data))
+        _, canonical, current_version, intervals, prerelease_filter = data
+        if intervals is None:
+            return cls(canonical, current_version)
+
+        specmask = cls.__new__(cls)
+        specmask.speckmask = canonical
+        specmask.validate_only = False
+        specmask.current_version = _parse_semver(current_version) if current_version else None
+        specmask.specs = ()
+        specmask.op = cls.OR if cls.OR in canonical else cls.AND
+        specmask.canonical = canonical
+        specmask.exclusions = frozenset()
+        specmask._exclusion_lengths = ()
+        specmask.intervals = IntervalSet((_decode_key(lo), _decode_key(hi)) for lo, hi in intervals)
+        specmask._majors = _major_ranges(specmask.intervals)
+        specmask.exact = True
+        specmask.prerelease_filter = prerelease_filter
+        specmask._freeze()
+        return specmask
+
+    def __reduce__(self):
+        return _deserialize_mask, (self.serialize(),)
+
+
+_SERIALIZED_MASK_FORMAT = 1
+
+
+def _deserialize_mask(data):
+    return SpecMask.deserialize(data)
+
+
+def _encode_key(key):
+    """A version key or key prefix as plain values: the _MAX bound marker, always last, becomes None"""
+    if key is None or key[-1] is not _MAX:
+        return key
+    return key[:-1] + (None,)
+
+
+def _decode_key(key):
+    if key is None or key[-1] is not None:
+        return key
+    return key[:-1] + (_MAX,)
+
+
+def _tuplify(value):
+    """Recursively turn the lists in value into tuples"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_tuplify(x) for x in value)
+    return value
+
+
+class _LRUCache(object):
+    """A small thread safe least recently used mapping, counting its hits and misses"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value  # most recently used go last
+            self.hits += 1
+            return value
+
+    def setdefault(self, key, value):
+        """Return the value cached for key, caching value first if there is none"""
+        with self._lock:
+            if key in self._data:
+                value = self._data.pop(key)
+            elif len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = value
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+_compiled_masks = _LRUCache()  # (mask string, current version string) -> SpecMask
+_canonical_masks = _LRUCache()  # SpecMask -> the one shared instance of all its equivalent SpecMasks
+
+
+def compile_mask(mask, current_version=None):
+    """Return a SpecMask for the mask and current version.  Compiled masks are cached, and all the equivalent masks
+       (per their canonical form) share the same SpecMask instance."""
+    _check_spec_count(mask, _active_limits())
+    key = (mask, '{}'.format(current_version) if current_version else None)
+    specmask = _compiled_masks.get(key)
+    if specmask is None:
+        current = _parse_semver(current_version) if current_version else None
+        specmask = SpecMask(mask, current)
+        specmask = _canonical_masks.setdefault(specmask, specmask)
+        _compiled_masks.setdefault(key, specmask)
+    return specmask
+
+
+def _bind_locks(mask, current_version):
+    """Return the mask with the LOCKs of its items substituted with the current version, raising ValueError when
+       that isn't possible"""
+    op = SpecMask.OR if SpecMask.OR in mask else SpecMask.AND
+    items = []
+    for item in mask.split(op):
+        item = item.strip()
+        next_best = '-' if item.startswith('-') else ''
+        match = SpecItemMask.re_specitemmask.match(item[len(next_best):])
+        if match and SpecItemMask.LOCK in match.group(2):
+            if current_version is None:
+                raise ValueError('Masks with LOCKs need a current_version')
+            item = next_best + match.group(1) + _substitute_locks(match.group(2), current_version)
+        items.append(item)
+    return ' {} '.format(op).join(items)
+
+
+def _newer_than_intervals(current_version):
+    """The IntervalSet of the versions newer than the current version, and whether it is exact"""
+    if current_version is None:
+        return IntervalSet.everything(), True
+    return _spec_intervals(semantic_version.Spec('>{}'.format(current_version)))
+
+
+def _fleet_positions(mask, current_version, index):
+    """The positions of the versions of index matching the mask for a (parsed) current version"""
+    try:
+        unbound = compile_mask(_bind_locks(mask, current_version))
+    except ValueError:
+        unbound = None  # compiling the mask with its current version below raises the actual error
+    if unbound is not None and unbound.exact:
+        newer, newer_exact = _newer_than_intervals(current_version)
+        if newer_exact:
+            return index.positions(unbound.intervals & newer, unbound.prerelease_filter)
+    return compile_mask(mask, current_version)._matching_positions(index)
+
+
+MaskDiagnostic = namedtuple('MaskDiagnostic', ['mask', 'valid', 'offset', 'reason'])
+
+# A conservative grammar for a single SpecItemMask: anything it matches is known to be valid, so the common masks can
+# be validated without building any SpecItemMask.  Anything else gets the full treatment.
+_re_num = r'(?:0|[1-9][0-9]*)'
+_re_component = r'(?:{num}|Y|L{num}?)'.format(num=_re_num)
+_re_identifier = r'(?:{num}|[0-9]*[A-Za-z][0-9A-Za-z-]*)'.format(num=_re_num)
+_re_valid_item = re.compile(
+    r'^\s*(?:\*|-?({comp}(?:\.{comp}(?:\.{comp})?)?)(?:-({ident}(?:\.{ident})*))?'
+    r'|(?:<=|<|>=|>|==|=|!=|\^|~=|~)({comp}(?:\.{comp}(?:\.{comp})?)?)(?:-({ident}(?:\.{ident})*))?)\s*$'.format(
+        comp=_re_component, ident=_re_identifier))
+
+
+def _is_valid_item(item):
+    match = _re_valid_item.match(item)
+    if not match:
+        return False
+    core, prerelease = match.group(1, 2) if match.group(1) else match.group(3, 4)
+    # lock parsing strips every copy of the version core from the mask, so it can't also be in the prerelease
+    return not (core and prerelease and SpecItemMask.LOCK in core + prerelease and core in prerelease)
+
+
+def _validate_mask(mask, limits=None):
+    """Validate a mask, returning a MaskDiagnostic.  The specs past the max_specs limit are reported as invalid."""
+    if not isinstance(mask, str):
+        return MaskDiagnostic(mask, False, 0, 'mask must be a string, not {}'.format(type(mask).__name__))
+
+    or_at, and_at = mask.find(SpecMask.OR), mask.find(SpecMask.AND)
+    if or_at != -1 and and_at != -1:
+        return MaskDiagnostic(mask, False, max(or_at, and_at),
+                              'SpecMask cannot contain both {} and {} operators'.format(SpecMask.OR, SpecMask.AND))
+    op = SpecMask.OR if or_at != -1 else SpecMask.AND
+
+    max_specs = (limits or _default_limits).max_specs
+    offset = 0
+    for count, item in enumerate(mask.split(op)):
+        if max_specs is not None and count >= max_specs:
+            return MaskDiagnostic(mask, False, offset - len(op),
+                                  'Mask has more than the limit of {} specs'.format(max_specs))
+        if not _is_valid_item(item):
+            try:
+                SpecItemMask(item.strip(), '1.1.1')  # arbitrary current version to handle masks with LOCKs
+            except ValueError as e:
+                item_offset = offset + len(item) - len(item.lstrip())
+                return MaskDiagnostic(mask, False, item_offset, '{}'.format(e))
+        offset += len(item) + len(op)
+    return MaskDiagnostic(mask, True, None, None)
+
+
+class YesVersionComponent(_Immutable):
     def __init__(self, str_val=None):
         self.component = str_val
+        self._freeze()
 
     def __eq__(self, other):
         if not self.component:
@@ -388,7 +1239,7 @@ class YesVersionComponent(object):
         return self.component == YesVersion.YES
 
 
-class YesVersion(object):
+class YesVersion(_Immutable):
     YES = 'Y'
     re_num = re.compile(r'^[0-9]+|Y$')
 
@@ -397,6 +1248,7 @@ class YesVersion(object):
         self.prerelease = None
         self.kind = kind_str
         self.parse(version_str)
+        self._freeze()
 
     def parse(self, version_str):
         """Parse a version_str into components"""
@@ -436,31 +1288,82 @@ class YesVersion(object):
         """Given the 'Y' mask, and a set of versions, return a list of all the versions that mask would expect to find
            in the range of versions, but do not actually exists."""
         fake_matches = set()
+        max_fake_versions = _active_limits().max_fake_versions
+
+        def check_span(values, candidates=0):
+            # every major (or minor) of the range expects at least one version, so the span of the range alone
+            # tells whether the mask expects too many
+            if max_fake_versions is not None and candidates + max(values) + 1 - min(values) > max_fake_versions:
+                raise LimitExceededError('Next best mask expects more than the limit of {} fake versions'.format(
+                    max_fake_versions))
+
+        # the minors of each major and the patches of each major.minor, rather than scanning versions for each
+        minors, patches = {}, {}
+        for v in versions:
+            minors.setdefault(v.major, set()).add(v.minor)
+            patches.setdefault((v.major, v.minor), set()).add(v.patch)
 
         if not self.major.is_yes:
             major_versions = [self.major.val()]
         else:
-            major_versions = sorted(set([v.major for v in versions]))
+            major_versions = list(minors)
+        if not major_versions:
+            return fake_matches  # no versions, nothing to expect
+        check_span(major_versions)
 
+        candidates = 0
         for major in range(min(major_versions), max(major_versions) + 1):
+            _check_deadline()
             if not self.minor.is_yes:
                 minor_versions = [self.minor.val()]
             else:
-                minor_versions = sorted(set([v.minor for v in versions if v.major == major]))
+                minor_versions = list(minors.get(major, ()))
+            if not minor_versions:
+                continue  # a major between the existing ones without any version, no minors to expect
+            check_span(minor_versions, candidates)
 
             for minor in range(min(minor_versions), max(minor_versions) + 1):
                 if not self.patch.is_yes:
                     patch_versions = [self.patch.val()]
                 else:
-                    patch_versions = sorted(set([v.patch for v in versions if v.major == major and v.minor == minor]))
+                    patch_versions = list(patches.get((major, minor), ()))
+                if not patch_versions:
+                    continue  # likewise for a minor without any version
+
+                check_span(patch_versions, candidates)
+                candidates += max(patch_versions) + 1 - min(patch_versions)
 
                 for patch in range(min(patch_versions), max(patch_versions) + 1):
-                    fake = _parse_semver("{}.{}.{}".format(major, minor, patch), makefake=True)
+                    fake = _FakeVersion("{}.{}.{}".format(major, minor, patch))
                     if fake not in versions:
                         fake_matches.add(fake)
 
         return fake_matches
 
+    def intervals(self):
+        """The IntervalSet of the versions sharing the leading, non YES, components of the mask, along with whether
+           it is exact given the prerelease_filter: it is when every component after those is a YES"""
+        prefix = ()
+        components = [self.major, self.minor, self.patch]
+        for component in components:
+            if component.is_yes:
+                break
+            try:
+                prefix += (component.val(),)
+            except ValueError:
+                # not a number, it won't match anything but a shorter prefix is still correct
+                return IntervalSet.prefixed(prefix) if prefix else IntervalSet.everything(), False
+        exact = all(component.is_yes for component in components[len(prefix):])
+        return IntervalSet.prefixed(prefix) if prefix else IntervalSet.everything(), exact
+
+    def prerelease_filter(self):
+        """The prerelease the matching versions must have: None for any, () for none (releases only)"""
+        if not self.prerelease:
+            return ()
+        if self.prerelease[0] == self.YES:
+            return None
+        return self.prerelease
+
     def major_valid(self, version):
         return self.major == version.major
 
@@ -482,7 +1385,7 @@ class YesVersion(object):
                 # no match
                 prerelease_valid = False
         else:
-            prerelease_valid = version.prerelease is ()
+            prerelease_valid = not version.prerelease
 
         return prerelease_valid
 
@@ -502,22 +1405,481 @@ class YesVersion(object):
         return ".".join([str(x) for x in [self.major, self.minor, self.patch] if x])
 
 
-def _parse_semver(version, makefake=False):
-    if isinstance(version, semantic_version.Version):
-        if makefake:
-            version.is_fake = True
+def _parse_versions(versions):
+    """Parse a list of version strings into a dict of Versions to their (first) position in versions, silently
+       skipping the ones that aren't valid semver"""
+    valid_versions = {}
+    for position, version in enumerate(_limited_versions(versions)):
+        try:
+            v = _parse_semver(version)
+        except InvalidSemverError:
+            continue  # skip invalid semver strings
+        except ValueError:
+            continue  # skip invalid semver strings
+        valid_versions.setdefault(v, position)
+    return valid_versions
+
+
+class _Max(object):
+    """Compares greater than anything else.  Appended to a key prefix it makes a bound that sorts right after all the
+       keys starting with that prefix."""
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return self is other
+
+    def __gt__(self, other):
+        return self is not other
+
+    def __ge__(self, other):
+        return True
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __hash__(self):
+        return 0
+
+    def __repr__(self):
+        return 'max'
+
+
+_MAX = _Max()
+_RELEASE = (1,)  # prerelease key of releases, sorts after every prerelease key
+
+
+def _prerelease_key(prerelease):
+    """Sort key of a prerelease tuple: numeric identifiers sort numerically and before alphanumeric ones, and no
+       prerelease at all sorts last"""
+    if not prerelease:
+        return _RELEASE
+    return (0,) + tuple((0, int(x)) if x.isdigit() else (1, x) for x in prerelease)
+
+
+def _prerelease_passes(version, prerelease_filter):
+    """Whether a version passes a prerelease filter, see YesVersion.prerelease_filter"""
+    if prerelease_filter is None:
+        return True
+    return prerelease_filter is not False and (version.prerelease or ()) == prerelease_filter
+
+
+def _version_key(version):
+    """Sort key of a Version, ordering keys orders the versions"""
+    if isinstance(version, ParsedVersion):
+        return version.sort_key
+    return _compute_version_key(version)
+
+
+def _compute_version_key(version):
+    return (version.major, version.minor, version.patch, _prerelease_key(version.prerelease), version.build or ())
+
+
+class ParsedVersion(_Immutable, semantic_version.Version):
+    """An immutable Version parsed from a version string, keeping that string and precomputing its sort key"""
+
+    def __init__(self, version_string, original_string=None):
+        # same attributes as semantic_version.Version.__init__, set without going through the frozen __setattr__
+        major, minor, patch, prerelease, build = self.parse(version_string)
+        self.__dict__.update(major=major, minor=minor, patch=patch, prerelease=prerelease, build=build, partial=False,
+                             original_string=version_string if original_string is None else original_string)
+        self.__dict__['sort_key'] = _compute_version_key(self)
+        self._freeze()
+
+
+class _FakeVersion(ParsedVersion):
+    """A version a next best mask expects to exist, but which isn't one of the versions being filtered"""
+    is_fake = True
+
+
+def _spec_prefix(spec):
+    """Key prefix of a (partial) Version from a spec.  A partial Version compares equal to every version whose key
+       starts with that prefix."""
+    prefix = (spec.major,)
+    for part in [spec.minor, spec.patch]:
+        if part is None:
+            return prefix
+        prefix += (part,)
+    if spec.prerelease is None:
+        return prefix
+    prefix += (_prerelease_key(spec.prerelease),)
+    if spec.build is None:
+        return prefix
+    return prefix + (spec.build,)
+
+
+class IntervalSet(_Immutable):
+    """A union of disjoint half open [lo, hi) intervals of version keys, sorted.  A None bound is unbounded."""
+
+    def __init__(self, intervals=()):
+        self.intervals = tuple(self._normalize(intervals))
+        self._freeze()
+
+    @classmethod
+    def everything(cls):
+        return cls([(None, None)])
+
+    @classmethod
+    def prefixed(cls, prefix):
+        """All the versions whose keys start with prefix"""
+        return cls([(prefix, prefix + (_MAX,))])
+
+    @staticmethod
+    def _normalize(intervals):
+        normalized = []
+        for lo, hi in sorted(intervals, key=lambda x: (x[0] is not None, x[0])):
+            if lo is not None and hi is not None and not lo < hi:
+                continue  # empty
+            if normalized:
+                last_lo, last_hi = normalized[-1]
+                if last_hi is None:
+                    break  # the last interval already covers everything after it
+                if lo is None or not last_hi < lo:
+                    normalized[-1] = (last_lo, None if hi is None else max(hi, last_hi))
+                    continue
+            normalized.append((lo, hi))
+        return normalized
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __and__(self, other):
+        result = []
+        for lo, hi in self.intervals:
+            for other_lo, other_hi in other.intervals:
+                new_lo = other_lo if lo is None else lo if other_lo is None else max(lo, other_lo)
+                new_hi = other_hi if hi is None else hi if other_hi is None else min(hi, other_hi)
+                result.append((new_lo, new_hi))
+        return IntervalSet(result)
+
+    def __or__(self, other):
+        return IntervalSet(self.intervals + other.intervals)
+
+    def __invert__(self):
+        result = []
+        lo = None
+        for interval_lo, interval_hi in self.intervals:
+            if interval_lo is not None:
+                result.append((lo, interval_lo))
+            lo = interval_hi
+            if lo is None:
+                break
+        else:
+            result.append((lo, None))
+        return IntervalSet(result)
+
+    def __contains__(self, key):
+        return any((lo is None or not key < lo) and (hi is None or key < hi) for lo, hi in self.intervals)
+
+    def __eq__(self, other):
+        if not isinstance(other, IntervalSet):
+            return NotImplemented
+        return self.intervals == other.intervals
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(tuple(self.intervals))
+
+    def __repr__(self):
+        return 'IntervalSet <{}>'.format(' | '.join(
+            '[{}, {})'.format(_format_key(lo, '-inf'), _format_key(hi, 'inf')) for lo, hi in self.intervals))
+
+
+def _major_ranges(intervals):
+    """The inclusive (lo, hi) ranges of the majors of the versions within an IntervalSet, a None bound being
+       unbounded, or None when the intervals don't bound the majors at all"""
+    if intervals is None:
+        return None
+    ranges = []
+    for lo, hi in intervals:
+        lo_major = lo[0] if lo and isinstance(lo[0], int) else None
+        hi_major = hi[0] if hi and isinstance(hi[0], int) else None
+        if hi_major is not None and len(hi) == 1:
+            hi_major -= 1  # below (major,), the versions of major itself aren't included
+        if lo_major is None and hi_major is None:
+            return None
+        ranges.append((lo_major, hi_major))
+    return tuple(ranges)
+
+
+def _may_be_in_majors(version, majors):
+    """Whether a version string (or bytes) may be within the major ranges of _major_ranges, judging by the number it
+       starts with.  Those not starting with a number are left to parsing."""
+    strip, dot = (b'v=', b'.') if isinstance(version, bytes) else ('v=', '.')
+    try:
+        major = int(version.lstrip(strip).partition(dot)[0])
+    except ValueError:
+        return True
+    return any((lo is None or lo <= major) and (hi is None or major <= hi) for lo, hi in majors)
+
+
+def _format_key(key, unbounded):
+    """Human readable form of a version key or key prefix"""
+    if key is None:
+        return unbounded
+    s = ''
+    for i, x in enumerate(key):
+        if x is _MAX:
+            return s + ('.max' if s else 'max')
+        if i < 3:
+            s += ('.' if i else '') + '{}'.format(x)
+        elif i == 3 and x != _RELEASE:
+            s += '-' + '.'.join('{}'.format(identifier) for _, identifier in x[1:])
+        elif i == 4 and x:
+            s += '+' + '.'.join(x)
+    return s
+
+
+def _partial_prefix_is_exact(spec):
+    """Whether versions compare to a spec's Version by their key prefix alone.  A partial Version with a prerelease
+       (or build), e.g. 2-rc.1, compares its major (and minor) and then its prerelease, skipping the missing parts:
+       2.5.0-rc.1 == 2-rc.1.  The versions it matches don't follow version order."""
+    return (spec.minor is not None and spec.patch is not None) or (spec.prerelease is None and spec.build is None)
+
+
+def _comparison_intervals(kind, spec):
+    """The IntervalSet of a comparison kind of SpecItem, or None for other kinds.  For specs whose prefix isn't exact
+       (see _partial_prefix_is_exact) it is a superset of the matching versions, bounded by their major (and minor)."""
+    prefix = _spec_prefix(spec)
+    after = prefix + (_MAX,)
+    if not _partial_prefix_is_exact(spec):
+        if kind in ['<', '<=']:
+            return IntervalSet([(None, after)])
+        if kind == '==':
+            return IntervalSet([(prefix, after)])
+        if kind in ['>=', '>']:
+            return IntervalSet([(prefix, None)])
+        if kind == '!=':
+            return IntervalSet.everything()
+        return None
+    if kind == '<':
+        return IntervalSet([(None, prefix)])
+    if kind == '<=':
+        return IntervalSet([(None, after)])
+    if kind == '==':
+        return IntervalSet([(prefix, after)])
+    if kind == '>=':
+        return IntervalSet([(prefix, None)])
+    if kind == '>':
+        return IntervalSet([(after, None)])
+    if kind == '!=':
+        return IntervalSet([(None, prefix), (after, None)])
+    return None
+
+
+_exact_comparisons = []
+
+
+def _comparisons_are_exact():
+    """Whether the installed semantic_version matches comparison specs by plain version order, the way
+       _comparison_intervals compiles them.  Checked once, on prerelease edge cases."""
+    if not _exact_comparisons:
+        cases = [('2.0.0-alpha', '<2.0.0'), ('1.9.0-alpha', '<2.0.0'), ('1.0.0-alpha', '>=1.0.0'),
+                 ('1.0.0-alpha', '==1.0.0'), ('1.0.0-alpha', '>1.0.0'), ('1.0.1-alpha', '>1.0.0'),
+                 ('2.0.0-rc.1', '<=1'), ('1.9.9', '<=1'), ('1.0.0', '!=1.0.0-rc.1'), ('1.0.0-rc.1', '>1.0.0-rc'),
+                 ('2.0.0-rc.1', '!=2-rc.1'), ('2.0.0-alpha', '<2.0-rc.2'), ('2.0.0-alpha', '>=2.0-rc.1'),
+                 ('1.2.3', '<=1-rc.1'), ('2.5.0-rc.1', '==2-rc.1'), ('1.0.2', '==1.0-alpha.1')]
+        exact = True
+        for version, spec in cases:
+            item = semantic_version.SpecItem(spec)
+            version = semantic_version.Version(version)
+            matches = version in semantic_version.Spec(spec)
+            in_intervals = _version_key(version) in _comparison_intervals(item.kind, item.spec)
+            # the intervals of specs with inexact prefixes only need to hold the matching versions
+            if matches != in_intervals and (matches or _partial_prefix_is_exact(item.spec)):
+                exact = False
+        _exact_comparisons.append(exact)
+    return _exact_comparisons[0]
+
+
+def _spec_intervals(spec):
+    """Compile a semantic_version Spec into an IntervalSet, returning it along with whether it is exact"""
+    intervals = IntervalSet.everything()
+    exact = True
+    for item in spec.specs:
+        if item.kind == '*':
+            continue
+        item_intervals = _comparison_intervals(item.kind, item.spec)
+        if item_intervals is not None:
+            intervals &= item_intervals
+            exact = exact and _comparisons_are_exact() and _partial_prefix_is_exact(item.spec)
+            continue
+
+        # caret and tilde ranges start at the spec, and never go past these upper bounds
+        exact = False
+        major, minor = item.spec.major, item.spec.minor
+        if item.kind == '~' and minor is not None:
+            upper = (major, minor + 1, 0, _MAX)
+        elif item.kind in ['^', '~', '~=']:
+            upper = (major + 1, 0, 0, _MAX)
+        else:
+            continue
+        intervals &= IntervalSet([(_spec_prefix(item.spec), upper)])
+    return intervals, exact
+
+
+class VersionIndex(object):
+    """A list of version strings parsed into Versions, de-duplicated and sorted in ascending order, along with their
+       sort keys for binary searches.  It acts as the (read only) sequence of the sorted Versions.
+
+    Invalid semver strings are silently skipped.  With assume_sorted the input order is kept rather than sorted, and
+    check_sorted verifies it (raising UnsortedVersionsError).  input_positions holds the position in versions of each
+    Version."""
+
+    def __init__(self, versions, assume_sorted=False, check_sorted=False):
+        self._prerelease_buckets = None
+        if not assume_sorted:
+            decorated = [(_version_key(v), v, i) for v, i in _parse_versions(versions).items()]
+            decorated.sort(key=lambda x: x[0])
+            self.keys = [key for key, _, _ in decorated]
+            self.versions = [v for _, v, _ in decorated]
+            self.input_positions = array('l', [i for _, _, i in decorated])
+            return
+
+        self.keys = []
+        self.versions = []
+        self.input_positions = array('l')
+        previous = None
+        for position, version in enumerate(_limited_versions(versions)):
+            try:
+                v = _parse_semver(version)
+            except InvalidSemverError:
+                continue  # skip invalid semver strings
+            except ValueError:
+                continue  # skip invalid semver strings
+            key = _version_key(v)
+            if previous is not None:
+                if key == previous:
+                    continue  # duplicates of a sorted list are neighbours
+                if check_sorted and key < previous:
+                    raise UnsortedVersionsError('{} is out of order, it sorts before {}'.format(
+                        version, self.versions[-1]))
+            self.keys.append(key)
+            self.versions.append(v)
+            self.input_positions.append(position)
+            previous = key
+
+    def __len__(self):
+        return len(self.versions)
+
+    def __getitem__(self, i):
+        return self.versions[i]
+
+    def results(self, positions, output=STRINGS):
+        """The version strings, Versions or input positions (see VersionFilter.semver_filter) at positions"""
+        if output == INDICES:
+            return [self.input_positions[i] for i in positions]
+        if output == VERSIONS:
+            return [self.versions[i] for i in positions]
+        return [self.versions[i].original_string for i in positions]
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    def ranges(self, intervals):
+        """The (start, stop) ranges of positions of the versions within an IntervalSet"""
+        keys = self.keys
+        return [(0 if lo is None else bisect.bisect_left(keys, lo),
+                 len(keys) if hi is None else bisect.bisect_left(keys, hi)) for lo, hi in intervals]
+
+    def positions(self, intervals, prerelease=None):
+        """The ascending positions of the versions within an IntervalSet, and with the given prerelease: None for
+           any, () for releases only, or a prerelease tuple.  Versions are looked up in the prerelease buckets so
+           the versions with other prereleases are never looked at."""
+        if prerelease is None:
+            return [i for start, stop in self.ranges(intervals) for i in range(start, stop)]
+
+        bucket = self.prerelease_buckets().get(prerelease, [])
+        positions = []
+        for start, stop in self.ranges(intervals):
+            positions.extend(bucket[bisect.bisect_left(bucket, start):bisect.bisect_left(bucket, stop)])
+        return positions
+
+    def reversed_positions(self, intervals, prerelease=None):
+        """The positions of positions(intervals, prerelease) in descending order, generated lazily so that only
+           taking the newest few of them costs no more than binary searches"""
+        bucket = self.prerelease_buckets().get(prerelease, []) if prerelease is not None else None
+        for start, stop in reversed(self.ranges(intervals)):
+            if bucket is None:
+                for i in range(stop - 1, start - 1, -1):
+                    yield i
+            else:
+                for j in range(bisect.bisect_left(bucket, stop) - 1, bisect.bisect_left(bucket, start) - 1, -1):
+                    yield bucket[j]
+
+    def count(self, intervals, prerelease=None):
+        """The number of positions positions(intervals, prerelease) would return, from binary searches alone"""
+        if prerelease is None:
+            return sum(stop - start for start, stop in self.ranges(intervals))
+        bucket = self.prerelease_buckets().get(prerelease, [])
+        return sum(bisect.bisect_left(bucket, stop) - bisect.bisect_left(bucket, start)
+                   for start, stop in self.ranges(intervals))
+
+    def prerelease_buckets(self):
+        """The ascending positions of the versions grouped by prerelease, releases under ().  Built on first use.
+
+        Within the index a base version's prereleases are contiguous and directly precede its release, so the
+        prereleases of a base version are found with IntervalSet.prefixed((major, minor, patch))."""
+        if self._prerelease_buckets is None:
+            buckets = {}
+            for i, v in enumerate(self.versions):
+                buckets.setdefault(v.prerelease or (), []).append(i)
+            self._prerelease_buckets = buckets
+        return self._prerelease_buckets
+
+
+def _bits_from_positions(positions, size):
+    """Build a bitset (an int with bit i set for every i in positions) out of positions in range(size)"""
+    if not size:
+        return 0
+    # Setting one bit at a time on an int is quadratic, build the binary digits (most significant first) instead
+    digits = bytearray(b'0' * size)
+    for i in positions:
+        digits[size - 1 - i] = 0x31  # '1'
+    return int(bytes(digits), 2)
+
+
+def _iter_bits(bits, reverse=False):
+    """Yield the positions of the set bits in a bitset, lowest first or highest first when reverse is set"""
+    digits = bin(bits)[2:]  # most significant first
+    top = len(digits) - 1
+    if reverse:
+        i = digits.find('1')
+        while i != -1:
+            yield top - i
+            i = digits.find('1', i + 1)
+    else:
+        digits = digits[::-1]
+        i = digits.find('1')
+        while i != -1:
+            yield i
+            i = digits.find('1', i + 1)
+
+
+def _parse_semver(version):
+    if isinstance(version, ParsedVersion):
         return version
+    if isinstance(version, semantic_version.Version):
+        return ParsedVersion(str(version))
     if isinstance(version, str):
         # strip leading 'v' and '=' chars
         cleaned = version.lstrip('v=')
         try:
-            v = semantic_version.Version(cleaned)
+            v = ParsedVersion(cleaned, version)
         except ValueError:
             v = semantic_version.Version.coerce(cleaned)
             if len(v.build) > 0:
                 raise InvalidSemverError('build fields should not be used')
-        v.original_string = version
-        if makefake:
-            v.is_fake = True
+            v = ParsedVersion(str(v), version)
         return v
     raise ValueError('version must be either a str or a Version object')